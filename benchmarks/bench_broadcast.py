@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    broadcast delivery latency of /stats/ws/broadcast with 1000 local websocket clients
+
+    one publisher sends its send time, every subscriber records receive - send,
+    a few stalled clients never read to show they do not hold back the others
+
+    python -m benchmarks.bench_broadcast
+"""
+import sys
+import time
+import socket
+import asyncio
+import multiprocessing
+import numpy as np
+import uvicorn
+import websockets
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _on_server(port):
+    uvicorn.run("web:app", host="127.0.0.1", port=port, log_level="warning", ws_max_queue=1024)
+
+
+async def _connect(url, retries=50):
+    for _ in range(retries):
+        try:
+            return await websockets.connect(url, max_queue=None, open_timeout=30)
+        except (OSError, websockets.InvalidHandshake, asyncio.TimeoutError):
+            await asyncio.sleep(0.2)
+    raise TimeoutError(url)
+
+
+async def _subscriber(ws, rounds, latencies):
+    for _ in range(rounds):
+        message = await ws.recv()
+        sent = float(message.rsplit(" ", 1)[-1])
+        latencies.append(time.perf_counter() - sent)
+
+
+async def _run(url, clients=1000, rounds=20, stalled=10):
+    subscribers = []
+    for ix in range(clients):
+        subscribers.append(await _connect(url))
+    # stalled consumers --- connected but never read
+    stalls = [await _connect(url) for _ in range(stalled)]
+    for ws in stalls:
+        ws.transport.pause_reading()
+    publisher = await _connect(url)
+
+    latencies = []
+    readers = [asyncio.create_task(_subscriber(ws, rounds, latencies)) for ws in subscribers]
+    reader = asyncio.create_task(_subscriber(publisher, rounds, []))
+    for _ in range(rounds):
+        await publisher.send(f"{time.perf_counter()}")
+        await asyncio.sleep(0.2)
+    await asyncio.wait_for(asyncio.gather(*readers, reader), timeout=120)
+    for ws in subscribers + stalls + [publisher]:
+        await ws.close()
+    return np.array(latencies)
+
+
+if __name__ == "__main__":
+
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    port = _free_port()
+    proc = multiprocessing.Process(target=_on_server, args=(port,))
+    proc.start()
+    try:
+        latencies = asyncio.run(_run(f"ws://127.0.0.1:{port}/stats/ws/broadcast", clients=clients))
+        p50, p99, pmax = np.percentile(latencies, [50, 99, 100]) * 1e3
+        print(f"clients={clients} messages={len(latencies)} p50={p50:.1f}ms p99={p99:.1f}ms max={pmax:.1f}ms")
+    finally:
+        proc.terminate()
+        proc.join()
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    python time of the token ---> user query on the request path
+
+    a. select built per request, no compiled cache (every request compiles)
+    b. select built per request, compiled cache (statement + cache key rebuilt every request)
+    c. prebuilt core.ops.statements entry + params, compiled cache (cache key memoized)
+
+    python -m benchmarks.bench_compile [--url sqlite+aiosqlite://]
+"""
+import time
+import uuid
+import asyncio
+import argparse
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from core.ops.schema import Base, User, Token
+from core.ops.statements import statements
+
+
+async def _timeit(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        await func()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+async def _on_engine(url, query_cache_size):
+    engine = create_async_engine(url, query_cache_size=query_cache_size)
+    async with engine.begin() as conn:
+        # only the tables of the query, sqlite rejects the composite autoincrement keys of the others
+        await conn.run_sync(Base.metadata.create_all, tables=[User.__table__, Token.__table__])
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with factory() as session:
+        async with session.begin():
+            user = User(name="bench", phone=1234567890)
+            user.token = Token()
+            session.add(user)
+        token = user.token.token
+    return engine, factory, token
+
+
+async def main(url, number=5000):
+    results = {}
+    for name, query_cache_size, prebuilt in (("a. built, no cache", 0, False),
+                                            ("b. built, cached", 1200, False),
+                                            ("c. prebuilt, cached", 1200, True)):
+        engine, factory, token = await _on_engine(url, query_cache_size)
+
+        async with factory() as session:
+            async def per_request():
+                if prebuilt:
+                    result = await session.execute(statements["token_user"], {"token": token})
+                else:
+                    req = select(Token).options(joinedload(Token.user)).where(Token.token == token)
+                    result = await session.execute(req)
+                assert result.scalars().first().user.name == "bench"
+            # warm the compiled cache
+            await per_request()
+            results[name] = await _timeit(per_request, number)
+        await engine.dispose()
+    for name, cost in results.items():
+        print(f"{name:22s}: {cost:8.1f} us / request")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite+aiosqlite://")
+    args = parser.parse_args()
+    asyncio.run(main(args.url))
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    throughput of the sticky dispatcher across 1 / 2 / 4 / 8 workers
+
+    every request synthesizes one session for its experiment (BtBroker.downsample, cpu bound),
+    64 experiments are spread over the workers by web.dispatch
+
+    python -m benchmarks.bench_dispatch
+"""
+import time
+import socket
+import asyncio
+import multiprocessing
+import httpx
+from fastapi import FastAPI
+from core.broker.broker import BtBroker
+from web.dispatch import serve
+from .bench_downsample import session
+
+app = FastAPI()
+minutes = session()
+
+
+@app.get("/bench")
+async def bench(experiment_id: str, session_ix: int):
+    # fresh broker ---> no tick cache hit, every request pays one synthesis
+    broker = BtBroker({"seed": 0, "synthesis": "minute"})
+    broker.downsample(minutes, "600001", session_ix)
+    return {"experiment_id": experiment_id, "pid": multiprocessing.current_process().pid}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait(url, timeout=30):
+    async with httpx.AsyncClient() as client:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, params={"experiment_id": "warmup", "session_ix": 20240102})
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(url)
+
+
+async def _blast(url, requests=500, concurrency=32, experiments=64):
+    pids = {}
+    queue = asyncio.Queue()
+    for ix in range(requests):
+        queue.put_nowait(ix)
+
+    async def _client(client):
+        while not queue.empty():
+            ix = queue.get_nowait()
+            experiment_id = f"exp-{ix % experiments}"
+            resp = await client.get(url, params={"experiment_id": experiment_id, "session_ix": 20240102 + ix})
+            pids.setdefault(experiment_id, set()).add(resp.json()["pid"])
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[_client(client) for _ in range(concurrency)])
+        cost = time.perf_counter() - start
+    # sticky ---> one pid per experiment
+    assert all(len(p) == 1 for p in pids.values())
+    return requests / cost
+
+
+if __name__ == "__main__":
+
+    for workers in (1, 2, 4, 8):
+        port = _free_port()
+        proc = multiprocessing.Process(target=serve,
+                                       kwargs={"workers": workers, "host": "127.0.0.1", "port": port,
+                                               "app": "benchmarks.bench_dispatch:app"})
+        proc.start()
+        url = f"http://127.0.0.1:{port}/bench"
+        try:
+            asyncio.run(_wait(url))
+            qps = asyncio.run(_blast(url))
+            print(f"workers={workers}: {qps:8.1f} req/s")
+        finally:
+            proc.terminate()
+            proc.join()
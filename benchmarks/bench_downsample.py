@@ -0,0 +1,30 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    minute -> 3s tick synthesis, per-minute Dist.infer loop vs one vectorized session pass
+
+    python -m benchmarks.bench_downsample
+"""
+import timeit
+import numpy as np
+from core.broker.broker import BtBroker
+
+
+def session(n=240, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.01, n))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + 0.01
+    low = np.minimum(open_, close) - 0.01
+    volume = rng.integers(1000, 10000, n).astype(np.float64)
+    return np.column_stack([open_, high, low, close, volume])
+
+
+if __name__ == "__main__":
+
+    minutes = session()
+    number = 200
+    for mode in ("minute", "batch"):
+        broker = BtBroker({"synthesis": mode})
+        cost = min(timeit.repeat(lambda: broker.downsample(minutes), number=number, repeat=5)) / number
+        print(f"{mode:>6}: {cost * 1e6:10.1f} us / session")
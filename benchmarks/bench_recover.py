@@ -0,0 +1,45 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    ledger recovery time after a restart --- latest snapshot + replay of the journal tail
+
+    n fills journaled with a snapshot every snapshot_every records, then a fresh registry
+    recovers the experiment from the same directory
+
+    python -m benchmarks.bench_recover [events]
+"""
+import sys
+import time
+import asyncio
+import datetime
+import tempfile
+from core.trade.ledger import LedgerRegistry, LedgerJournal
+from core.trade.order import Transaction
+
+
+async def _run(path, events, snapshot_every=10000):
+    registry = LedgerRegistry(kwargs={"tracker": "columnar"},
+                              journal=LedgerJournal(path, snapshot_every=snapshot_every, fsync_interval=None))
+    ledger = await registry.acquire("exp-1")
+    created_dt = datetime.datetime(2024, 1, 2, 10, 0)
+    start = time.perf_counter()
+    for ix in range(events):
+        await ledger._on_fill(Transaction(sid=f"{600000 + ix % 500}", size=100, price=10.0, cost=0,
+                                          created_dt=created_dt))
+    journaled = time.perf_counter() - start
+    registry.journal.close("exp-1")
+
+    start = time.perf_counter()
+    restarted = LedgerRegistry(kwargs={"tracker": "columnar"}, journal=LedgerJournal(path, snapshot_every=snapshot_every))
+    recovered = await restarted.acquire("exp-1")
+    recover = time.perf_counter() - start
+    assert recovered.avaiable == ledger.avaiable
+    return journaled, recover, restarted.journal._journals["exp-1"][1]
+
+
+if __name__ == "__main__":
+
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as path:
+        journaled, recover, tail = asyncio.run(_run(path, events))
+    print(f"events={events} journal={journaled / events * 1e6:.1f}us/event recover={recover * 1e3:.1f}ms tail={tail}")
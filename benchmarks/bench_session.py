@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    per request session overhead
+
+    a. sessionmaker built per get_db call vs async_sessionmaker built once
+    b. request of 3 statements --- one session + transaction per statement vs one unit of work
+
+    python -m benchmarks.bench_session [--url sqlite+aiosqlite://]
+"""
+import time
+import asyncio
+import argparse
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+
+async def _timeit(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        await func()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+async def bench_factory(engine, number=20000):
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def per_call():
+        session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)()
+        await session.close()
+
+    async def once():
+        session = factory()
+        await session.close()
+
+    print(f"sessionmaker per call : {await _timeit(per_call, number):8.1f} us")
+    print(f"factory built once    : {await _timeit(once, number):8.1f} us")
+
+
+async def bench_request(engine, number=2000, statements=3):
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    stmt = text("select 1")
+
+    async def per_statement():
+        for _ in range(statements):
+            async with factory() as session:
+                async with session.begin():
+                    await session.execute(stmt)
+
+    async def unit_of_work():
+        async with factory() as session:
+            async with session.begin():
+                for _ in range(statements):
+                    await session.execute(stmt)
+
+    print(f"session per statement : {await _timeit(per_statement, number):8.1f} us / request")
+    print(f"one unit of work      : {await _timeit(unit_of_work, number):8.1f} us / request")
+
+
+async def main(url):
+    engine = create_async_engine(url or "postgresql+psycopg://postgres@localhost/backtest")
+    await bench_factory(engine)
+    # statements need a reachable database
+    if url:
+        await bench_request(engine)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.url))
@@ -1,18 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import zlib
 import numpy as np
 import itertools
 import datetime
 from typing import Any, List
 import numpy as np
 from utils.dt_utilty import elapsed, str2dt, loc2dt
+from utils.cache import LRUCache
 # from six import with_metaclass
 from meta import ParamBase
 from core.trade.commission import *
 from core.trade.order import BaseOrder, Transaction
 from .dist import *
 from .restrict import Untradeable
+from .tick import TickSession
 
 
 class BtBroker(ParamBase):
@@ -30,6 +33,11 @@ class BtBroker(ParamBase):
         ("epsilon", 0.05),
         ("dist", "beta"),
         ("commission", "exchange"),
+        # batch --- whole session in one vectorized pass / minute --- Dist.infer per snapshot
+        ("synthesis", "batch"),
+        # synthesized sessions kept by (sid, session, dist, seed)
+        ("cache_size", 256),
+        ("seed", None),
     )
 
     def __init__(self, kwargs):
@@ -39,21 +47,28 @@ class BtBroker(ParamBase):
         self.slippage_factor = kwargs.pop("slippage_factor", self.p.slippage_factor) 
         self.commission = commission_factory[self.p.commission]
         self.restrict = Untradeable(kwargs.pop("epsilon", self.p.epsilon))
+        self.dist_name = kwargs.pop("dist", self.p.dist)
+        self.synthesis = kwargs.pop("synthesis", self.p.synthesis)
+        self.seed = kwargs.pop("seed", self.p.seed)
+        self.dist = dist_factory[self.dist_name](self.seed)
+        self.tick_cache = LRUCache(kwargs.pop("cache_size", self.p.cache_size))
 
     async def _logical_deal(self, pos, downsamples, ord: BaseOrder) -> Transaction:
-        ask_price = downsamples[0][pos + self.p.delay]
+        # delayed tick, orders near the close deal on the last tick
+        pos = min(pos + self.delay, len(downsamples[0]) - 1)
+        ask_price = downsamples[0][pos]
         fee_ratio = self.commission.calc_rate(ord)
         # slippage_price and slippage_vol
         slip_price = ask_price * ( 1 + self.slippage_factor) * (1 + fee_ratio)
-        slip_vol = ord.calc_volume(slip_price) if ord.direction == 1 else ord.volume
+        slip_vol = ord.calc_volume(slip_price)
         if slip_vol:
             # estimate impact on market
-            tolerate_vol = downsamples[1][pos + self.p.delay] * self.p.impact
+            tolerate_vol = downsamples[1][pos] * self.impact_factor
             filled_vol = slip_vol if slip_vol <= tolerate_vol else tolerate_vol
 
             # create transaction
             trade_cost = fee_ratio * filled_vol * slip_price
-            transaction = Transaction(sid=ord.sid, 
+            transaction = Transaction(sid=ord.asset.sid, 
                                       price=slip_price, 
                                       size=filled_vol, 
                                       cost=trade_cost)
@@ -61,33 +76,80 @@ class BtBroker(ParamBase):
         return ''
     
     async def _on_tick(self, ord: BaseOrder, downsamples) -> Transaction:
-        seconds = elapsed(ord.created_dt)
-        pos = int(np.ceil(seconds/3))
+        pos = self.on_loc(ord.created_dt)
         txn = await self._logical_deal(pos, downsamples, ord)
-        # set txn created_dt
-        txn.created_dt = str2dt(ord.created_dt) + datetime.timedelta(seconds=self.p.delay) 
+        if txn:
+            # set txn created_dt
+            txn.created_dt = str2dt(str(ord.created_dt)) + datetime.timedelta(seconds=3 * self.delay) 
         return txn
 
-    async def _on_price(self, ord: BaseOrder, downsamples) -> Transaction:
-        locs = np.argwhere(downsamples[0] <= ord.price) if ord.direction == 1 else np.argwhere(downsamples[0] >= ord.price)
-        if len(locs):
-            txn = await self._logical_deal(locs[0][0], downsamples, ord)
-            # set txn created_dt
-            txn.created_dt = loc2dt(locs[0][0], ord.created_dt) + datetime.timedelta(seconds=self.p.delay)  
-            return txn
+    async def _on_price(self, ord: BaseOrder, downsamples: TickSession) -> Transaction:
+        # ticks before the order existed never fill it
+        loc = int(downsamples.first_touch(ord.price, ord.direction, self.on_loc(ord.created_dt)))
+        if loc < len(downsamples):
+            return await self._on_loc(loc, ord, downsamples)
         return ''
-    
-    def downsample(self, minutes):
+
+    async def _on_loc(self, loc, ord: BaseOrder, downsamples) -> Transaction:
+        txn = await self._logical_deal(loc, downsamples, ord)
+        if txn:
+            # set txn created_dt
+            txn.created_dt = loc2dt(loc, ord.created_dt) + datetime.timedelta(seconds=3 * self.delay)  
+        return txn
+
+    @staticmethod
+    def on_block(minutes) -> np.ndarray:
+        """
+            minutes (records / columns mapping / DataFrame / ndarray) -> np.array (n, ohlcv)
+        """
+        if isinstance(minutes, np.ndarray):
+            return minutes.astype(np.float64, copy=False)
+        if isinstance(minutes, dict):
+            return np.column_stack([np.asarray(minutes[k], dtype=np.float64) for k in OHLCV])
+        if hasattr(minutes, "columns"):
+            return minutes.loc[:, list(OHLCV)].to_numpy(dtype=np.float64)
+        return np.array([[m[k] for k in OHLCV] for m in minutes], dtype=np.float64)
+
+    @staticmethod
+    def on_loc(created_dt) -> int:
+        """
+            %Y%m%d%H%M ---> first 3s tick of the session at or after created_dt
+        """
+        return int(np.ceil(elapsed(created_dt) / 3))
+
+    @staticmethod
+    def on_session(created_dt) -> int:
+        """
+            %Y%m%d%H%M ---> %Y%m%d
+        """
+        return int(str(created_dt)[:8])
+
+    def downsample(self, minutes, sid=None, session=None) -> TickSession:
         """
             m -> 3s tick
+            sid / session given ---> reuse the ticks already synthesized for (sid, session, dist, seed, block)
         """
-        dist = dist_factory[self.p.dist]
-        ticks = [dist.infer(snapshot) for snapshot in minutes]
-        tick_prices = [item[0] for item in ticks]
-        tick_vols = [item[1] for item in ticks]
-        price_arrays = np.array(itertools.chain(*tick_prices))
-        vol_arrays = np.array(itertools.chain(*tick_vols)) 
-        return price_arrays, vol_arrays
+        if sid is None or session is None:
+            return self._downsample(minutes)
+
+        block = np.ascontiguousarray(self.on_block(minutes))
+        # length + crc32 fingerprint ---> corrected or partial minutes of a session are synthesized again
+        key = (sid, session, self.dist_name, self.seed, len(block), zlib.crc32(block))
+        try:
+            return self.tick_cache.get(key, [session])
+        except KeyError:
+            downsamples = self._downsample(block, self.dist.stream(sid, session))
+            self.tick_cache.set(key, downsamples, [session, session])
+            return downsamples
+
+    def _downsample(self, minutes, rng=None):
+        block = self.on_block(minutes)
+        if self.synthesis == "batch":
+            return TickSession(*self.dist.infer_batch(block, rng))
+        ticks = [self.dist.infer(snapshot, rng) for snapshot in block]
+        price_arrays = np.fromiter(itertools.chain(*[item[0] for item in ticks]), dtype=np.float64)
+        vol_arrays = np.fromiter(itertools.chain(*[item[1] for item in ticks]), dtype=np.float64)
+        return TickSession(price_arrays, vol_arrays)
 
     async def on_trade(self, order: BaseOrder, minutes: List[dict]) -> Transaction:
         """
@@ -98,11 +160,44 @@ class BtBroker(ParamBase):
         # np.logical_and(txn.match_price>=restricted.channel[0], txn.match_price<=restricted.channel[1]):
         restricted = self.restrict.is_restricted(order.asset, order.created_dt)
         if not restricted:
-            downsamples = self.downsample(minutes)
+            downsamples = self.downsample(minutes, order.asset.sid, self.on_session(order.created_dt))
             if order.order_type == 4:
                 txn = await self._on_tick(order, downsamples)
             else:
                 txn = await self._on_price(order, downsamples)
             return txn
         return ''
+
+    async def match_batch(self, orders: List[BaseOrder], minutes: List[dict]) -> List[Transaction]:
+        """
+            match orders of one sid against one session
+            ticks are synthesized once and first-touch of every limit order is resolved together
+            return transactions aligned with orders ('' when restricted or not filled)
+        """
+        if not orders:
+            return []
+        head = orders[0]
+        if not all(ord.asset.sid == head.asset.sid and self.on_session(ord.created_dt) == self.on_session(head.created_dt)
+                   for ord in orders):
+            # one synthesized session per call, grouped by Ledger.on_trade_batch
+            raise ValueError("match_batch orders must share one sid and session")
+        downsamples = self.downsample(minutes, head.asset.sid, self.on_session(head.created_dt))
+        limit_ix = [ix for ix, ord in enumerate(orders) if ord.order_type != 4]
+        locs = downsamples.first_touch([orders[ix].price for ix in limit_ix],
+                                       [orders[ix].direction for ix in limit_ix],
+                                       [self.on_loc(orders[ix].created_dt) for ix in limit_ix])
+        touched = dict(zip(limit_ix, locs.tolist()))
+
+        txns = []
+        for ix, ord in enumerate(orders):
+            if self.restrict.is_restricted(ord.asset, ord.created_dt):
+                txn = ''
+            elif ord.order_type == 4:
+                txn = await self._on_tick(ord, downsamples)
+            elif touched[ix] < len(downsamples):
+                txn = await self._on_loc(touched[ix], ord, downsamples)
+            else:
+                txn = ''
+            txns.append(txn)
+        return txns
     
\ No newline at end of file
@@ -1,31 +1,94 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
+import zlib
 import numpy as np
-import itertools
-
-import numpy as np
-from numpy.random import default_rng # type: ignore
+from numpy.random import default_rng, SeedSequence # type: ignore
 # from six import with_metaclass
 from meta import ParamBase
 
 
+# minute snapshot layout --- open / high / low / close / volume
+OHLCV = ("open", "high", "low", "close", "volume")
+
+
 class Dist(ParamBase):
+
+    def __init__(self, seed=None):
+        # experiment root seed --- seed None draws fresh entropy once per experiment
+        self.seed_seq = SeedSequence(seed)
+        self.rng = default_rng(self.seed_seq)
+
+    def stream(self, sid, session):
+        """
+            child generator of (sid, session), same spawn_key as SeedSequence.spawn but keyed
+            by (sid, session) instead of spawn order so that parallel workers draw identical ticks
+        """
+        sid_key = int(sid) if str(sid).isdigit() else zlib.crc32(str(sid).encode())
+        child = SeedSequence(self.seed_seq.entropy,
+                             spawn_key=self.seed_seq.spawn_key + (sid_key, int(session)),
+                             pool_size=self.seed_seq.pool_size)
+        return default_rng(child)
         
     @staticmethod
     def on_align(downsamples, snapshot):
         """
             align ohlcv by snapshot 
+            high / low anchor on inner ticks so that open / close are never overwritten
         """
         downsamples[0] = snapshot[0]
         downsamples[-1] = snapshot[-1]
-        max_idx = np.argmax(downsamples)
+        max_idx = np.argmax(downsamples[1:-1]) + 1
         downsamples[max_idx] = np.max(snapshot)
-        min_idx = np.argmin(downsamples)
+        min_idx = np.argmin(downsamples[1:-1]) + 1
         downsamples[min_idx] = np.min(snapshot)
         return downsamples
-    
-    def infer(self, datas):
-        raise NotImplementedError("240/m minute to 4800 3/s tick")
+
+    @staticmethod
+    def on_align_batch(downsamples, block):
+        """
+            vectorized on_align, downsamples: (n, size) ticks / block: (n, ohlcv) minutes
+            same anchoring order as on_align --- open, close, then high, then low
+        """
+        rows = np.arange(len(downsamples))
+        downsamples[:, 0] = block[:, 0]
+        downsamples[:, -1] = block[:, 3]
+        max_idx = np.argmax(downsamples[:, 1:-1], axis=1) + 1
+        downsamples[rows, max_idx] = np.max(block[:, :4], axis=1)
+        min_idx = np.argmin(downsamples[:, 1:-1], axis=1) + 1
+        downsamples[rows, min_idx] = np.min(block[:, :4], axis=1)
+        return downsamples
+
+    def prob_dist(self, shape=None, rng=None):
+        raise NotImplementedError("tick weights of one minute")
+
+    def infer(self, snapshot, rng=None):
+        """
+            snapshot: np.array[open, high, low, close, volume] of one minute
+        """
+        probs = self.prob_dist(rng=rng)
+        low, high = np.min(snapshot[:4]), np.max(snapshot[:4])
+        # ohlc
+        tick_prices = (high - low) * probs + low
+        align_tick_prices = self.on_align(tick_prices, snapshot=snapshot[:4])
+        # volume
+        tick_vols = snapshot[4] * probs / np.sum(probs)
+        return align_tick_prices, tick_vols
+
+    def infer_batch(self, block, rng=None):
+        """
+            block: np.array (240, ohlcv) of one session ---> (4800, ) prices and volumes
+            one rng draw and one alignment for the whole session instead of per minute
+        """
+        block = np.asarray(block, dtype=np.float64)
+        probs = self.prob_dist(shape=(len(block), self.p.size), rng=rng)
+        low = np.min(block[:, :4], axis=1, keepdims=True)
+        high = np.max(block[:, :4], axis=1, keepdims=True)
+        # ohlc
+        tick_prices = (high - low) * probs + low
+        align_tick_prices = self.on_align_batch(tick_prices, block)
+        # volume
+        tick_vols = block[:, 4:5] * probs / np.sum(probs, axis=1, keepdims=True)
+        return align_tick_prices.ravel(), tick_vols.ravel()
     
 
 class Beta(Dist):
@@ -40,38 +103,27 @@ class Beta(Dist):
         ("prior", {"a":1, "b": 2})
     )
 
-    def prob_dist(self):
-        rng = default_rng()
-        probs = rng.beta(a=self.p.prior["a"], b=self.p.prior["b"], size=self.p.size)
-        return probs
-
-    def infer(self, snapshot):
+    def prob_dist(self, shape=None, rng=None):
         """
-            snapshot: np.array[t-1,t]
             beta distribution
         """
-        aggerated_vol = snapshot[-1]["volume"]
-        delta = np.max(snapshot[:, -1]) - np.min(snapshot[:, -1])
-        probs = self.prob_dist(snapshot)
-        # ohlc
-        tick_prices = delta * np.array(probs) + np.min(snapshot)
-        align_tick_prices = self.on_align(tick_prices, snapshot=snapshot)
-        # volume
-        ratio = np.array(probs) / np.sum(probs)
-        tick_vols = aggerated_vol * ratio
-        return align_tick_prices, tick_vols
+        rng = self.rng if rng is None else rng
+        shape = self.p.size if shape is None else shape
+        probs = rng.beta(a=self.p.prior["a"], b=self.p.prior["b"], size=shape)
+        return probs
 
 
 class Linear(Beta):
 
     params = (("size", 20),)
 
-    def prob_dist(self):
+    def prob_dist(self, shape=None, rng=None):
         """
             linear sample
         """
-        probs = range(1, self.p.size+1) / self.p.size
-        return probs
+        probs = np.arange(1, self.p.size+1) / self.p.size
+        shape = self.p.size if shape is None else shape
+        return np.broadcast_to(probs, shape).copy()
 
 
 dist_factory = {
@@ -79,4 +131,4 @@ dist_factory = {
     "linear": Linear
 }
 
-__all__ = ["dist_factory"]
+__all__ = ["dist_factory", "OHLCV"]
@@ -70,6 +70,9 @@ class Untradeable(Restricted):
         return flag 
 
     def is_restricted(self, assets, dt):
+        if isinstance(assets, Asset):
+            # single order asset ---> delisted on or before the %Y%m%d(%H%M) session
+            return assets.delist != 0 and assets.delist <= int(str(dt)[:8])
 
         filter_assets = [asset for asset in assets if asset.delist != 0 and asset.delist > dt]
         filter_assets = [asset for asset in filter_assets if not self.on_suspended(asset.metadata)]
@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+class TickSession(object):
+    """
+        synthesized 3s ticks of one session with running min / max index
+        running_min is non-increasing and running_max non-decreasing, so the first tick
+        touching a limit price is a binary search instead of an argwhere scan
+
+        orders created after the open search from their own tick ---> sparse table of block
+        min / max (min / max of prices[i:i + 2 ** k]), built on first use, one jump per level
+
+        behaves like (price_arrays, vol_arrays) --- downsamples[0] / downsamples[1]
+    """
+    __slots__ = ["prices", "vols", "running_min", "running_max", "neg_running_min", "_sparse"]
+
+    def __init__(self, prices, vols):
+        self.prices = prices
+        self.vols = vols
+        self.running_min = np.minimum.accumulate(prices)
+        self.running_max = np.maximum.accumulate(prices)
+        # non-decreasing ---> searched directly by buy orders, negated once per session
+        self.neg_running_min = np.negative(self.running_min)
+        # shared by every order of the session
+        for arr in (self.prices, self.vols, self.running_min, self.running_max, self.neg_running_min):
+            arr.flags.writeable = False
+        self._sparse = None
+
+    def _on_sparse(self):
+        """
+            (mins, maxs) of shape (levels, n + 2 ** (levels - 1)), row k ---> min / max of prices[i:i + 2 ** k],
+            padded with +inf / -inf past the close so jumps never touch a missing tick
+        """
+        if self._sparse is None:
+            size = len(self.prices)
+            levels = max(size - 1, 0).bit_length() + 1
+            width = size + 2 ** (levels - 1)
+            mins = np.full((levels, width), np.inf)
+            maxs = np.full((levels, width), -np.inf)
+            mins[0, :size] = maxs[0, :size] = self.prices
+            for k in range(1, levels):
+                half = 2 ** (k - 1)
+                mins[k, :width - half] = np.minimum(mins[k - 1, :width - half], mins[k - 1, half:])
+                maxs[k, :width - half] = np.maximum(maxs[k - 1, :width - half], maxs[k - 1, half:])
+            mins.flags.writeable = maxs.flags.writeable = False
+            self._sparse = (mins, maxs)
+        return self._sparse
+
+    def first_touch(self, limits, directions, starts=0):
+        """
+            first tick >= start where price <= limit (direction 1 buy) / price >= limit (sell)
+            scalar or array limits / starts, len(self) means the limit is never touched
+        """
+        limits = np.asarray(limits, dtype=np.float64)
+        directions = np.asarray(directions)
+        starts = np.minimum(np.asarray(starts, dtype=np.int64), len(self))
+        if not starts.any():
+            buy_locs = np.searchsorted(self.neg_running_min, -limits, side="left")
+            sell_locs = np.searchsorted(self.running_max, limits, side="left")
+            return np.where(directions == 1, buy_locs, sell_locs)
+
+        # ticks [start, loc) never touched ---> jump 2 ** k ahead while the next block misses the limit
+        mins, maxs = self._on_sparse()
+        buy = directions == 1
+        locs = np.broadcast_to(starts, np.broadcast(limits, directions, starts).shape).copy()
+        last = mins.shape[1] - 1
+        for k in range(len(mins) - 1, -1, -1):
+            # past the padding every block is +inf / -inf anyway
+            ix = np.minimum(locs, last)
+            missed = np.where(buy, mins[k][ix] > limits, maxs[k][ix] < limits)
+            locs += np.where(missed, 2 ** k, 0)
+        return np.minimum(locs, len(self))
+
+    def __getitem__(self, ix):
+        return (self.prices, self.vols)[ix]
+
+    def __iter__(self):
+        return iter((self.prices, self.vols))
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __repr__(self):
+        return f"TickSession(size={len(self.prices)}, low={self.running_min[-1] if len(self) else None}, high={self.running_max[-1] if len(self) else None})"
+
+
+__all__ = ["TickSession"]
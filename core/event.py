@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 #-*- coding: utf-8 -*-
 
+import numpy as np
 from typing import List, Any, Dict, Union, Mapping
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Base64Bytes, field_validator, model_validator
 from core.trade.meta import OrderMeta
 
 
@@ -52,6 +53,27 @@ class SyncEvent(BaseModel):
     #         datetime: lambda v: v.strftime('%Y-%m-%d %H:%M:%S')
     #     }
 
+class SyncArrayEvent(BaseModel):
+    """
+        close prices as aligned arrays --- sids + base64 of little-endian float64 closes
+        e.g. base64.b64encode(np.asarray(closes, dtype="<f8").tobytes())
+    """
+
+    session_ix: int
+    sids: List[str]
+    closes: Base64Bytes
+    token: str
+    experiment_id: str
+
+    @model_validator(mode="after")
+    def aligned(self):
+        assert len(self.closes) == 8 * len(self.sids), "closes must be one float64 per sid"
+        return self
+
+    def on_closes(self) -> np.ndarray:
+        return np.frombuffer(self.closes, dtype="<f8")
+
+
 class MetricEvent(BaseModel):
 
     start_dt: int
@@ -66,4 +88,4 @@ class RespEvent(BaseModel):
      error: str
 
 
-__all__ = ["LoginEvent", "TradeEvent", "EquityEvent", "SyncEvent", "RespEvent"]
+__all__ = ["LoginEvent", "TradeEvent", "EquityEvent", "SyncEvent", "SyncArrayEvent", "RespEvent"]
@@ -0,0 +1,134 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    append only journal of length prefixed frames split in numbered segments
+
+    frame ---> <uint32 length><uint32 crc32><payload>
+    segment ---> {seq:012d}.log, rotate() closes the active segment, drop(seq) deletes segments <= seq
+"""
+import os
+import glob
+import time
+import zlib
+import struct
+from typing import Iterator, Optional
+
+HEADER = struct.Struct("<II")
+
+
+class Journal(object):
+    """
+        durable append log, a torn frame at the tail (crash while writing) is truncated on open
+
+    Parameters
+    ----------
+    path : str
+        directory holding the segments
+    flush_interval : float
+        seconds between flushes of the write buffer to the os, 0 ---> every append
+    fsync_interval : float
+        seconds between fsync of the active segment, 0 ---> every append, None ---> never (os decides)
+    """
+    def __init__(self, path: str, flush_interval: float = 0.0, fsync_interval: Optional[float] = 1.0):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        segments = self.segments()
+        self.seq = segments[-1] if segments else 0
+        if segments:
+            self._on_repair(self._on_segment(self.seq))
+        self._file = open(self._on_segment(self.seq), "ab")
+        self._flushed = self._synced = time.monotonic()
+        self._dirty = False
+
+    def _on_segment(self, seq: int) -> str:
+        return os.path.join(self.path, f"{seq:012d}.log")
+
+    def segments(self) -> list:
+        return sorted(int(os.path.basename(name)[:-4]) for name in glob.glob(os.path.join(self.path, "*.log")))
+
+    @staticmethod
+    def _on_frames(name: str) -> Iterator[tuple]:
+        """
+            (end offset, payload) of every valid frame, stops at the first torn or corrupted frame
+        """
+        with open(name, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            length, crc = HEADER.unpack_from(data, offset)
+            end = offset + HEADER.size + length
+            payload = data[offset + HEADER.size:end]
+            if end > len(data) or zlib.crc32(payload) != crc:
+                return
+            offset = end
+            yield offset, payload
+
+    def _on_repair(self, name: str):
+        end = 0
+        for end, _ in self._on_frames(name):
+            pass
+        if end != os.path.getsize(name):
+            with open(name, "r+b") as f:
+                f.truncate(end)
+
+    def append(self, payload: bytes):
+        self._file.write(HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        self._dirty = True
+        self.sync(force=False)
+
+    def sync(self, force: bool = True):
+        """
+            flush / fsync once their interval elapsed, force ---> both now
+        """
+        if not self._dirty:
+            return
+        now = time.monotonic()
+        if force or now - self._flushed >= self.flush_interval:
+            self._file.flush()
+            self._flushed = now
+            if self.fsync_interval is not None and (force or now - self._synced >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._synced = now
+                self._dirty = False
+
+    def rotate(self) -> int:
+        """
+            close the active segment and open the next one ---> seq of the closed segment
+        """
+        self.sync()
+        self._file.close()
+        closed, self.seq = self.seq, self.seq + 1
+        self._file = open(self._on_segment(self.seq), "ab")
+        return closed
+
+    def drop(self, upto: int):
+        """
+            delete segments <= upto once their content is persisted elsewhere
+        """
+        for seq in self.segments():
+            if seq <= upto and seq != self.seq:
+                os.remove(self._on_segment(seq))
+
+    def replay(self, upto: Optional[int] = None) -> Iterator[bytes]:
+        """
+            payloads of every segment (<= upto) in append order
+        """
+        self.sync()
+        for seq in self.segments():
+            if upto is not None and seq > upto:
+                break
+            for _, payload in self._on_frames(self._on_segment(seq)):
+                yield payload
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def __repr__(self):
+        return f"Journal(path={self.path}, seq={self.seq})"
+
+
+__all__ = ["Journal"]
@@ -0,0 +1,79 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    in place column migrations of existing tables
+
+    create_all never alters a table that already exists ---> columns whose declared type changed
+    after the table shipped are altered here, run by the schema bootstrap after create_all
+
+    account.positions text json ---> core.trade.codec bytea: rows are re-encoded (hex text) in
+    chunks, then the column is altered with decode(positions, 'hex')
+"""
+import json
+from typing import List, Mapping, Tuple
+from sqlalchemy import text
+from core.trade.codec import encode_positions
+
+# (table, column) ---> postgres data_type (information_schema) of the declared column
+COLUMN_TYPES = {
+    # %Y%m%d%H%M exceeds int4
+    ("_order", "created_dt"): "bigint",
+    ("transaction", "created_dt"): "bigint",
+}
+# run once every text row holds the hex of its encoding
+POSITIONS_DDL = 'ALTER TABLE "account" ALTER COLUMN "positions" TYPE bytea USING decode("positions", \'hex\')'
+
+
+def columns_ddl(current: Mapping[Tuple[str, str], str]) -> List[str]:
+    """
+        ALTER of every COLUMN_TYPES column whose current type differs, missing columns are left to create_all
+    """
+    return [f'ALTER TABLE "{table}" ALTER COLUMN "{column}" TYPE {data_type}'
+            for (table, column), data_type in COLUMN_TYPES.items()
+            if current.get((table, column), data_type) != data_type]
+
+
+def reencode_positions(positions: str) -> str:
+    """
+        json text of get_positions() ---> hex of its codec encoding (still a text value)
+    """
+    return encode_positions(json.loads(positions)).hex()
+
+
+async def migrate_positions(conn, chunksize: int = 1000) -> int:
+    """
+        re-encode every text account.positions row then alter the column to bytea, returns the rows count
+    """
+    select_req = text('SELECT id, positions FROM "account" WHERE id > :last ORDER BY id LIMIT :limit')
+    update_req = text('UPDATE "account" SET positions = :positions WHERE id = :id')
+    last, count = 0, 0
+    while True:
+        rows = (await conn.execute(select_req, {"last": last, "limit": chunksize})).all()
+        if not rows:
+            break
+        await conn.execute(update_req, [{"id": row_id, "positions": reencode_positions(positions)}
+                                        for row_id, positions in rows])
+        last, count = rows[-1][0], count + len(rows)
+    await conn.execute(text(POSITIONS_DDL))
+    return count
+
+
+async def column_types(conn) -> Mapping[Tuple[str, str], str]:
+    req = text("SELECT table_name, column_name, data_type FROM information_schema.columns "
+               "WHERE table_schema = current_schema()")
+    return {(table, column): data_type for table, column, data_type in (await conn.execute(req)).all()}
+
+
+async def migrate(conn) -> List[str]:
+    """
+        apply the pending column migrations (async connection inside a transaction)
+    """
+    current = await column_types(conn)
+    ddl = columns_ddl(current)
+    for statement in ddl:
+        await conn.execute(text(statement))
+    if current.get(("account", "positions")) == "text":
+        await migrate_positions(conn)
+        ddl.append(POSITIONS_DDL)
+    return ddl
+
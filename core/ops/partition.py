@@ -0,0 +1,145 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    history table indexes and postgres range partitioning
+
+    create_all only creates indexes together with new tables ---> ensure_indexes adds the missing
+    ones to existing tables; migrate_ddl turns a plain table into a range partitioned one in place
+
+    postgres requires every unique constraint of a partitioned table to contain the partition key,
+    _order / transaction are referenced through their unique order_id / transaction_id, so only
+    account (nothing references it) is partitioned
+
+    python -m core.ops.partition --start 2015 --end 2030 [--dry-run]
+"""
+import argparse
+from typing import List, Tuple
+from sqlalchemy import Table, text, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, AddConstraint
+from .schema import Base
+
+# table ---> (partition column, yyyymmdd scale of the column)
+PARTITIONS = {
+    "account": ("date", 10000),
+}
+
+
+def ensure_indexes(conn, metadata=Base.metadata) -> List[str]:
+    """
+        create declared indexes missing on existing tables (sync connection, run_sync)
+    """
+    inspector = inspect(conn)
+    created = []
+    for table in metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                created.append(index.name)
+    return created
+
+
+def on_yearly(start: int, end: int, scale: int = 10000) -> List[Tuple[str, int, int]]:
+    """
+        [start, end) years ---> (suffix, lower, upper) bounds of a yyyymmdd (scale 10000) column
+    """
+    return [(f"y{year}", year * scale, (year + 1) * scale) for year in range(start, end)]
+
+
+def partitions_ddl(name: str, ranges: List[Tuple[str, int, int]], default: bool = True) -> List[str]:
+    """
+        range partitions (+ default partition catching rows outside every range)
+    """
+    ddl = [f'CREATE TABLE IF NOT EXISTS "{name}_{suffix}" PARTITION OF "{name}" FOR VALUES FROM ({lower}) TO ({upper})'
+           for suffix, lower, upper in ranges]
+    if default:
+        ddl.append(f'CREATE TABLE IF NOT EXISTS "{name}_default" PARTITION OF "{name}" DEFAULT')
+    return ddl
+
+
+def migrate_ddl(table: Table, ranges: List[Tuple[str, int, int]], keep_legacy: bool = False) -> List[str]:
+    """
+        plain table ---> range partitioned table of the same name, rows copied, run in one transaction
+
+        a. rename the table, its primary key and its indexes to *_legacy
+        b. create the partitioned parent (columns + defaults), primary key extended by the partition key
+        c. partitions, foreign keys and indexes, rows copied, serial sequence handed over
+    """
+    name = table.name
+    column, _ = PARTITIONS[name]
+    legacy = f"{name}_legacy"
+    dialect = postgresql.dialect()
+    pkey = table.primary_key.name or f"{name}_pkey"
+    keys = [c.name for c in table.primary_key.columns]
+    keys += [column] if column not in keys else []
+    keys = ", ".join(f'"{key}"' for key in keys)
+
+    ddl = [f'ALTER TABLE "{name}" RENAME TO "{legacy}"',
+           f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{pkey}" TO "{legacy}_pkey"']
+    ddl += [f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_legacy"' for index in table.indexes]
+    ddl += [f'CREATE TABLE "{name}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY RANGE ("{column}")',
+            f'ALTER TABLE "{name}" ADD CONSTRAINT "{pkey}" PRIMARY KEY ({keys})']
+    ddl += partitions_ddl(name, ranges)
+    ddl += [str(AddConstraint(fk).compile(dialect=dialect)) for fk in table.foreign_key_constraints]
+    ddl += [str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes]
+    ddl += [f'INSERT INTO "{name}" SELECT * FROM "{legacy}"']
+    # serial sequence is owned by the legacy column, dropping it would drop the sequence
+    ddl += [f"DO $$ BEGIN IF pg_get_serial_sequence('{legacy}', '{c.name}') IS NOT NULL THEN "
+            f"EXECUTE format('ALTER SEQUENCE %s OWNED BY \"{name}\".\"{c.name}\"', "
+            f"pg_get_serial_sequence('{legacy}', '{c.name}')); END IF; END $$"
+            for c in table.primary_key.columns]
+    if not keep_legacy:
+        ddl.append(f'DROP TABLE "{legacy}"')
+    return ddl
+
+
+async def is_partitioned(conn, name: str) -> bool:
+    req = text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+               "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :name)")
+    return bool((await conn.execute(req, {"name": name})).scalar())
+
+
+async def migrate(conn, start: int, end: int, keep_legacy: bool = False) -> List[str]:
+    """
+        partition every PARTITIONS table not partitioned yet (async connection inside a transaction)
+        already partitioned tables only get the missing range partitions
+    """
+    migrated = []
+    for name, (_, scale) in PARTITIONS.items():
+        table = Base.metadata.tables[name]
+        ranges = on_yearly(start, end, scale)
+        if await is_partitioned(conn, name):
+            # new years only, rows already in the default partition block their range
+            ddl = partitions_ddl(name, ranges, default=False)
+        else:
+            ddl = migrate_ddl(table, ranges, keep_legacy)
+            migrated.append(name)
+        for statement in ddl:
+            await conn.execute(text(statement))
+    return migrated
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", type=int, default=2015)
+    parser.add_argument("--end", type=int, default=2030)
+    parser.add_argument("--keep-legacy", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        for name, (_, scale) in PARTITIONS.items():
+            for statement in migrate_ddl(Base.metadata.tables[name], on_yearly(args.start, args.end, scale),
+                                         args.keep_legacy):
+                print(statement + ";")
+    else:
+        import asyncio
+        from .operator import async_ops
+
+        async def _run():
+            await async_ops.initialize()
+            async with async_ops.engine.begin() as conn:
+                print("partitioned", await migrate(conn, args.start, args.end, args.keep_legacy))
+        asyncio.run(_run())
@@ -2,16 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import hashlib
 import uuid
 from typing import List
 from typing import Optional
 from sqlalchemy import func
-from sqlalchemy import Integer, String, ForeignKey, BigInteger, Text, UUID
+from sqlalchemy import Integer, String, ForeignKey, BigInteger, Text, UUID, LargeBinary
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import PrimaryKeyConstraint
+from sqlalchemy.schema import PrimaryKeyConstraint, Index, CreateTable, CreateIndex
+from sqlalchemy.dialects import postgresql
 
 
 # declarative base class
@@ -105,11 +107,14 @@ class Order_Transaction(Base):
 class Order(Base):
 
     __tablename__ = "_order"
-    __table_args__ = {"extend_existing": True}
+    # experiment history scans by time
+    __table_args__ = (Index("ix_order_experiment_created", "experiment_id", "created_dt"), 
+                      {"extend_existing": True})
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     sid: Mapped[str] = mapped_column(String(10), nullable=False, use_existing_column=True)
-    created_dt: Mapped[int] = mapped_column(Integer, nullable=False, use_existing_column=True)
+    # %Y%m%d%H%M exceeds int4
+    created_dt: Mapped[int] = mapped_column(BigInteger, nullable=False, use_existing_column=True)
     order_id: Mapped[str] = mapped_column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True, unique=True, use_existing_column=True)
     order_type: Mapped[int] = mapped_column(Integer, nullable=False, use_existing_column=True)
     price: Mapped[int] = mapped_column(Integer, nullable=False, use_existing_column=True)
@@ -130,11 +135,14 @@ class Order(Base):
 class Transaction(Base):
 
     __tablename__ = "transaction"
-    __table_args__ = {"extend_existing": True}
+    # no experiment_id column ---> reached through its order
+    __table_args__ = (Index("ix_transaction_order_created", "order_id", "created_dt"), 
+                      {"extend_existing": True})
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     sid: Mapped[str] = mapped_column(String(10), nullable=False, use_existing_column=True)
-    created_dt: Mapped[int] = mapped_column(Integer, nullable=False, use_existing_column=True)
+    # %Y%m%d%H%M exceeds int4
+    created_dt: Mapped[int] = mapped_column(BigInteger, nullable=False, use_existing_column=True)
     transaction_id: Mapped[str] = mapped_column(String(64), primary_key=True, nullable=False, unique=True, use_existing_column=True)
     price: Mapped[int] = mapped_column(Integer, nullable=False, use_existing_column=True)
     volume: Mapped[int] = mapped_column(BigInteger, nullable=False, use_existing_column=True)
@@ -151,11 +159,14 @@ class Transaction(Base):
 class Account(Base):
 
     __tablename__ = "account"
-    __table_args__ = {"extend_existing": True}
+    # /stats/on_stats ---> experiment + date range
+    __table_args__ = (Index("ix_account_experiment_date", "experiment_id", "date"), 
+                      {"extend_existing": True})
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     date: Mapped[int] = mapped_column(Integer, nullable=False)
-    positions: Mapped[str] = mapped_column(Text, nullable=False, use_existing_column=True)
+    # core.trade.codec columnar encoding (bytea), was Text json
+    positions: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, use_existing_column=True)
     portfolio: Mapped[int] = mapped_column(BigInteger, nullable=False, use_existing_column=True)
     balance: Mapped[int] = mapped_column(Integer, nullable=False, use_existing_column=True)
     account_id: Mapped[int] = mapped_column(ForeignKey("user_info.account_id", ondelete="CASCADE"), use_existing_column=True)
@@ -167,3 +178,27 @@ class Account(Base):
     experiments: Mapped[List["Experiment"]] = relationship(
         back_populates="account", cascade="all, delete")
 
+
+class SchemaVersion(Base):
+
+    # one row --- schema_version of the bootstrap that last created / migrated this database
+    __tablename__ = "schema_version"
+    __table_args__ = {"extend_existing": True}
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[str] = mapped_column(String(40), nullable=False)
+
+
+def schema_version(*extra) -> str:
+    """
+        hash of the declared ddl (tables + indexes, postgres dialect) and extra bootstrap options
+        ---> a cached reflected schema is only reused while it is unchanged
+    """
+    dialect = postgresql.dialect()
+    digest = hashlib.sha1()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    digest.update(repr(extra).encode())
+    return digest.hexdigest()
@@ -0,0 +1,58 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    named statements of the request path, built once with bindparam placeholders
+
+    the same statement object is executed with a parameter dict every request ---> its cache key
+    is memoized and the engine compiled cache (query_cache_size) returns the compiled form
+
+    await async_ops.on_query_obj(statements["token_user"], params={"token": token})
+"""
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import joinedload
+from .schema import User, Token, Experiment, Account
+
+
+class StatementRegistry(object):
+    """
+        name ---> prebuilt parameterized statement
+    """
+    def __init__(self):
+        self._statements = {}
+
+    def register(self, name: str, statement):
+        assert name not in self._statements, f"statement {name} already registered"
+        self._statements[name] = statement
+        return statement
+
+    def __getitem__(self, name):
+        return self._statements[name]
+
+    def __contains__(self, name):
+        return name in self._statements
+
+    def __iter__(self):
+        return iter(self._statements)
+
+
+statements = StatementRegistry()
+
+statements.register("token_user",
+                    select(Token).options(joinedload(Token.user)).where(Token.token == bindparam("token")))
+statements.register("user_login",
+                    select(User).where(User.name == bindparam("name"), User.phone == bindparam("phone")))
+statements.register("user_token",
+                    select(Token).where(Token.user_id == bindparam("user_id")))
+statements.register("user_experiments",
+                    select(Experiment).where(Experiment.user_id == bindparam("user_id")))
+statements.register("user_experiment",
+                    select(Experiment).where(Experiment.user_id == bindparam("user_id"),
+                                             Experiment.experiment_id == bindparam("experiment_id")))
+statements.register("experiment_accounts",
+                    select(Account).join(Experiment, Account.experiment_id == Experiment.id)
+                                   .where(Experiment.user_id == bindparam("user_id"),
+                                          Experiment.experiment_id == bindparam("experiment_id"),
+                                          Account.date >= bindparam("start_dt"),
+                                          Account.date <= bindparam("end_dt")))
+
+__all__ = ["statements", "StatementRegistry"]
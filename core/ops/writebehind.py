@@ -0,0 +1,168 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    write behind persistence --- rows are acknowledged once journaled, a background task
+    flushes them to postgres in coalesced batches
+
+    put(table, row) ---> journal segment + memory buffer ---> flush ---> every table in one transaction ---> drop segment
+    a batch failing max_retries flushes in a row is moved to path/failed (a journal of the same frames) and dropped
+"""
+import os
+import asyncio
+import logging
+import pickle
+from collections import defaultdict
+from typing import Dict, Any, Optional
+from meta import with_metaclass, MetaBase
+from .journal import Journal
+from .operator import async_ops
+from .schema import Base
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind(with_metaclass(MetaBase, object)):
+    """
+        at least once delivery: rows journaled before a crash are replayed on start,
+        a batch committed right before a crash (segment not yet dropped) is written again ---> rows
+        whose unique key (order_id, transaction_id ...) already exists are skipped, replay is idempotent
+    """
+    params = (
+        ("enabled", False),
+        ("path", "journal/write_behind"),
+        ("batch_size", 5000),
+        ("flush_interval", 0.05),
+        ("journal_flush_interval", 0.0),
+        ("fsync_interval", 1.0),
+        ("max_retries", 5),
+    )
+
+    def __init__(self, **kwargs):
+        self.enabled = kwargs.pop("enabled", self.p.enabled)
+        self.path = kwargs.pop("path", self.p.path)
+        self.batch_size = kwargs.pop("batch_size", self.p.batch_size)
+        self.flush_interval = kwargs.pop("flush_interval", self.p.flush_interval)
+        self.journal_flush_interval = kwargs.pop("journal_flush_interval", self.p.journal_flush_interval)
+        self.fsync_interval = kwargs.pop("fsync_interval", self.p.fsync_interval)
+        self.max_retries = kwargs.pop("max_retries", self.p.max_retries)
+        self.journal = None
+        self.flushed = 0
+        # rows moved aside after max_retries failed flushes
+        self.failed = 0
+        self._retries = 0
+        self._buffer = defaultdict(list)
+        self._size = 0
+        self._task = None
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        # parents flushed before children (order ---> transaction ---> order_transaction)
+        self._order = {table.name: ix for ix, table in enumerate(Base.metadata.sorted_tables)}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def put(self, table_name: str, row: Dict[str, Any]):
+        """
+            journal the row and buffer it for the next flush, returns once the journal holds it
+        """
+        self.journal.append(pickle.dumps((table_name, row), protocol=pickle.HIGHEST_PROTOCOL))
+        self._buffer[table_name].append(row)
+        self._size += 1
+        if self._size >= self.batch_size:
+            self._wakeup.set()
+
+    async def start(self):
+        """
+            open the journal, replay rows left by a previous run and start the flush task
+        """
+        self.journal = Journal(self.path, flush_interval=self.journal_flush_interval,
+                               fsync_interval=self.fsync_interval)
+        for payload in self.journal.replay():
+            table_name, row = pickle.loads(payload)
+            self._buffer[table_name].append(row)
+            self._size += 1
+        await self.flush()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # rows stay journaled, retried on the next round (or moved aside by flush)
+                logger.exception("write behind flush failed")
+
+    async def flush(self) -> int:
+        """
+            swap the buffer and rotate the journal together, insert the batch, then drop its segments
+        """
+        async with self._lock:
+            self.journal.sync()
+            if not self._size:
+                return 0
+            buffer, size = self._buffer, self._size
+            self._buffer, self._size = defaultdict(list), 0
+            sealed = self.journal.rotate()
+            try:
+                # all or nothing ---> a failed table never leaves its parents committed
+                async with async_ops.get_conn() as conn:
+                    for table_name in sorted(buffer, key=lambda name: self._order.get(name, len(self._order))):
+                        await async_ops.on_bulk_insert(table_name, buffer[table_name], conn=conn, skip_conflicts=True)
+            except Exception:
+                self._retries += 1
+                if self._retries >= self.max_retries:
+                    # one bad row must not block the queue forever
+                    self._on_failed(buffer, size, sealed)
+                else:
+                    # put the batch back in front, its segments stay on disk
+                    for table_name, rows in self._buffer.items():
+                        buffer[table_name].extend(rows)
+                    self._buffer, self._size = buffer, size + self._size
+                raise
+            self._retries = 0
+            self.journal.drop(sealed)
+            self.flushed += size
+            return size
+
+    def _on_failed(self, buffer, size: int, sealed: int):
+        """
+            journal the batch under path/failed for inspection / manual replay, then drop its segments
+        """
+        failed = Journal(os.path.join(self.path, "failed"), fsync_interval=0)
+        try:
+            for table_name, rows in buffer.items():
+                for row in rows:
+                    failed.append(pickle.dumps((table_name, row), protocol=pickle.HIGHEST_PROTOCOL))
+        finally:
+            failed.close()
+        self.journal.drop(sealed)
+        self.failed += size
+        self._retries = 0
+        logger.error("write behind batch of %d rows moved to %s after %d failed flushes",
+                     size, failed.path, self.max_retries)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.journal is not None:
+            await self.flush()
+            self.journal.close()
+
+    def __len__(self):
+        return self._size
+
+
+write_behind = WriteBehind()
+
+__all__ = ["write_behind", "WriteBehind"]
@@ -0,0 +1,61 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    columnar binary encoding of a positions snapshot (Account.positions bytea)
+
+    <uint8 version><uint32 rows> + sid block (S10 per row) + one float64 block per column
+"""
+import struct
+from typing import Mapping, Sequence, Dict
+import numpy as np
+
+VERSION = 1
+HEADER = struct.Struct("<BI")
+# sid is String(10) in the schema
+SID_DTYPE = np.dtype("S10")
+COLUMNS = ("size", "avaiable", "cost_basis", "price")
+
+
+def encode_arrays(sids: Sequence[str], size, avaiable, cost_basis, price) -> bytes:
+    """
+        parallel sid / column arrays ---> bytes
+    """
+    rows = len(sids)
+    sids = np.asarray(sids, dtype=str)
+    # S10 would silently truncate a longer sid
+    if rows and np.char.str_len(sids).max() > SID_DTYPE.itemsize:
+        raise ValueError(f"sid longer than {SID_DTYPE.itemsize} bytes")
+    blocks = [HEADER.pack(VERSION, rows), sids.astype(SID_DTYPE).tobytes()]
+    for column in (size, avaiable, cost_basis, price):
+        column = np.ascontiguousarray(column, dtype="<f8")
+        if len(column) != rows:
+            raise ValueError("columns are not aligned with sids")
+        blocks.append(column.tobytes())
+    return b"".join(blocks)
+
+
+def encode_positions(positions: Mapping[str, Mapping[str, float]]) -> bytes:
+    """
+        get_positions() mapping sid ---> {size, avaiable, cost_basis, price} ---> bytes
+    """
+    sids = list(positions)
+    return encode_arrays(sids, *[[positions[sid][name] for sid in sids] for name in COLUMNS])
+
+
+def decode_positions(blob: bytes) -> Dict[str, np.ndarray]:
+    """
+        bytes ---> {"sid": str array, column: float64 array}, float columns are read only views on blob
+    """
+    version, rows = HEADER.unpack_from(blob, 0)
+    if version != VERSION:
+        raise ValueError(f"unsupported positions encoding {version}")
+    offset = HEADER.size
+    decoded = {"sid": np.frombuffer(blob, dtype=SID_DTYPE, count=rows, offset=offset).astype(str)}
+    offset += rows * SID_DTYPE.itemsize
+    for name in COLUMNS:
+        decoded[name] = np.frombuffer(blob, dtype="<f8", count=rows, offset=offset)
+        offset += rows * 8
+    return decoded
+
+
+__all__ = ["encode_arrays", "encode_positions", "decode_positions"]
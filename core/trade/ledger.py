@@ -6,15 +6,29 @@ Created on Tue Mar 12 15:37:47 2019
 
 @author: python
 """
-from typing import List, Tuple
-from core.trade.position import PositionTracker
+import os
+import uuid
+import pickle
+import time
+from collections import defaultdict, OrderedDict
+from typing import List, Tuple, Callable, Optional, Union
+from core.trade.position import tracker_factory, PositionTracker
 from core.broker.broker import BtBroker
-from core.event import EquityEvent, TradeEvent, SyncEvent
+from core.event import EquityEvent, TradeEvent, SyncEvent, SyncArrayEvent
 from core.const import DEFAULT_CAPITAL_BASE
 from core.trade.portfolio import Portfolio
 from core.trade.order import create_order
+from core.trade.codec import encode_arrays
+from core.ops.journal import Journal
 from .meta import AccountMeta, MetricsMeta
 
+# journaled fields of the replayed events ---> the request envelope (token, experiment_id) never reaches the disk
+JOURNAL_EVENTS = {
+    "equity": (EquityEvent, ("event_type", "meta")),
+    "sync": (SyncEvent, ("session_ix", "meta")),
+    "sync_arrays": (SyncArrayEvent, ("session_ix", "sids", "closes")),
+}
+
 
 class Ledger(object):
     """
@@ -22,11 +36,14 @@ class Ledger(object):
         position_tracker 
     """
     def __init__(self, kwargs={}):        
-        self.position_tracker = PositionTracker()
+        # "object" tracker (Position) is legacy, columnar by default
+        self.position_tracker = tracker_factory[kwargs.get("tracker", "columnar")]()
         self._broker = BtBroker(kwargs)
         balance = kwargs.get("initial_balance", DEFAULT_CAPITAL_BASE)
         self.portfolio = Portfolio(balance)
         self.avaiable = balance
+        # (kind, record) ---> event journal, set by LedgerRegistry when journaling is on
+        self.on_journal = None
     
     def getbroker(self):
         '''
@@ -35,6 +52,8 @@ class Ledger(object):
         This is also available as a ``property`` by the name ``broker``
         '''
         return self._broker
+
+    broker = property(getbroker)
     
     def _brokernotify(self):
         '''
@@ -66,18 +85,61 @@ class Ledger(object):
         #    """
         order = create_order(event.orderMeta)
         txn = await self.broker.on_trade(order, event.payload)
-        self.position_tracker.update(txn)
-        self.avaiable += txn.price * txn.size
+        await self._on_fill(txn)
         return order, txn
+
+    async def on_trade_batch(self, events: List[TradeEvent]):
+        """
+            orders of one experiment in submission order
+            orders on the same sid and session are matched against one synthesized session
+        """
+        orders = [create_order(event.orderMeta) for event in events]
+        groups = defaultdict(list)
+        for ix, order in enumerate(orders):
+            groups[(order.asset.sid, self.broker.on_session(order.created_dt))].append(ix)
+
+        txns = [''] * len(orders)
+        for ixs in groups.values():
+            matched = await self.broker.match_batch([orders[ix] for ix in ixs], events[ixs[0]].payload)
+            for ix, txn in zip(ixs, matched):
+                txns[ix] = txn
+        # apply fills in submission order
+        for txn in txns:
+            await self._on_fill(txn)
+        return orders, txns
+
+    async def _on_fill(self, txn):
+        if txn:
+            await self.position_tracker.update([txn])
+            self.portfolio.exposure.on_fill(txn.sid, txn.size, txn.price)
+            self.avaiable += txn.price * txn.size
+            if self.on_journal is not None:
+                # fills rather than orders ---> replay does not depend on the broker synthesis
+                self.on_journal("fill", txn)
     
     async def on_event(self, event: EquityEvent):
         """
             dividends and rights
         """
         data = await self.position_tracker.process_event(event)
+        if event.event_type == "split" and event.meta:
+            for sid, dividend in event.meta.items():
+                self.portfolio.exposure.on_split(sid, PositionTracker._calc_ratio(dividend)[0])
         self.avaiable += data
+        if self.on_journal is not None:
+            self.on_journal("equity", self.on_record("equity", event))
+
+    def on_metrics(self) -> MetricsMeta:
+        """
+            intraday metrics straight from the incremental exposure, no position scan
+        """
+        exposure = self.portfolio.exposure
+        pnl, _ = exposure.on_pnl()
+        return MetricsMeta(pnl=pnl, 
+                           usage=exposure.market_value / self.portfolio.initial_balance, 
+                           portfolio_weight=exposure.weights())
     
-    async def on_end_of_day(self, event: SyncEvent)-> Tuple[AccountMeta, MetricsMeta]:
+    async def on_end_of_day(self, event: Union[SyncEvent, SyncArrayEvent])-> Tuple[AccountMeta, MetricsMeta]:
         """
             sync close price on positions
             Clear out any assets that have expired and positions which volume is zero before starting a new sim day.
@@ -85,14 +147,272 @@ class Ledger(object):
             close_position events for any assets that have reached their
             close_date.
         """
-        await self.position_tracker.syncronize(event.meta, event.session_ix) 
-        positions = self.position_tracker.get_positions()
-        portfolio_value, pnl, usage = self.portfolio.calc_portfolio(event.session_ix, positions)
-        account = AccountMeta(date=event.session_ix, positions=positions, portfolio = portfolio_value, balance=self.avaiable)  
+        exposure = self.portfolio.exposure
+        if isinstance(event, SyncArrayEvent):
+            closes = event.on_closes()
+            await self.position_tracker.syncronize_arrays(event.sids, closes, event.session_ix)
+            for sid, close in zip(event.sids, closes.tolist()):
+                exposure.on_mark(sid, close)
+        else:
+            await self.position_tracker.syncronize(event.meta, event.session_ix) 
+            for sid, close in event.meta.items():
+                exposure.on_mark(sid, close)
+        # packed sid / size / avaiable / cost_basis / price columns
+        positions = encode_arrays(*self.position_tracker.get_arrays())
+        # value / pnl / weights from the incremental exposure
+        portfolio_value, pnl, usage = self.portfolio.on_session(event.session_ix, self.avaiable)
+        # integer columns of the account table
+        account = AccountMeta(date=event.session_ix, positions=positions, portfolio=round(portfolio_value), 
+                              balance=round(self.avaiable))  
         # metrics
-        portfolio_weight = self.portfolio.current_portfolio_weights(positions)
+        portfolio_weight = exposure.weights()
         metrics = MetricsMeta(pnl=pnl, usage=usage, portfolio_weight=portfolio_weight)
+        if self.on_journal is not None:
+            kind = "sync_arrays" if isinstance(event, SyncArrayEvent) else "sync"
+            self.on_journal(kind, self.on_record(kind, event))
         return (account, metrics)
+
+    def on_state(self) -> dict:
+        """
+            positions, portfolio and balance (broker is rebuilt from kwargs)
+        """
+        return {"position_tracker": self.position_tracker, 
+                "portfolio": self.portfolio, 
+                "avaiable": self.avaiable}
+
+    @staticmethod
+    def on_record(kind: str, event) -> dict:
+        return {name: getattr(event, name) for name in JOURNAL_EVENTS[kind][1]}
+
+    async def on_replay(self, kind: str, record):
+        """
+            re-apply one journaled record
+        """
+        if kind == "fill":
+            await self._on_fill(record)
+        elif kind in JOURNAL_EVENTS:
+            # fields only, rebuilt without validation (already validated when journaled)
+            event = JOURNAL_EVENTS[kind][0].model_construct(**record)
+            if kind == "equity":
+                await self.on_event(event)
+            else:
+                await self.on_end_of_day(event)
+        else:
+            raise ValueError(f"unknown journal record {kind}")
     
 
-ledger = Ledger()
+class LedgerJournal(object):
+    """
+        per experiment event journal (fills / equity / sync records) with periodic snapshots
+        recovery ---> latest snapshot + replay of the journal tail written after it
+
+        path/{experiment_id hex}/{seq}.log + path/{experiment_id hex}/snapshot.pkl
+        experiment ids that do not parse as a uuid raise ValueError (never joined into a path)
+
+    Parameters
+    ----------
+    path : str
+        root directory of the experiment journals
+    snapshot_every : int
+        records appended before the next snapshot, bounds the tail replayed on recovery
+    fsync_interval : float
+        seconds between fsync of the active segment, see Journal
+    """
+    def __init__(self, path: str, snapshot_every: int = 10000, fsync_interval: Optional[float] = 1.0):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.fsync_interval = fsync_interval
+        # experiment_id hex ---> [journal, records since the last snapshot]
+        self._journals = {}
+
+    @staticmethod
+    def _on_key(experiment_id: str) -> str:
+        # canonical hex ---> no path separators / dots, one journal per experiment whatever the spelling
+        return uuid.UUID(str(experiment_id)).hex
+
+    def _on_dir(self, experiment_id: str) -> str:
+        return os.path.join(self.path, self._on_key(experiment_id))
+
+    def _on_journal(self, experiment_id: str) -> list:
+        key = self._on_key(experiment_id)
+        try:
+            return self._journals[key]
+        except KeyError:
+            entry = self._journals[key] = [Journal(self._on_dir(experiment_id), 
+                                                   fsync_interval=self.fsync_interval), 0]
+            return entry
+
+    def __contains__(self, experiment_id):
+        return os.path.isdir(self._on_dir(experiment_id))
+
+    def append(self, experiment_id: str, kind: str, record) -> bool:
+        """
+            journal one record ---> True once a snapshot is due
+        """
+        entry = self._on_journal(experiment_id)
+        entry[0].append(pickle.dumps((kind, record), protocol=pickle.HIGHEST_PROTOCOL))
+        entry[1] += 1
+        return entry[1] >= self.snapshot_every
+
+    def snapshot(self, experiment_id: str, ledger: Ledger):
+        """
+            seal the active segment, write the state atomically, then drop the sealed segments
+        """
+        entry = self._on_journal(experiment_id)
+        sealed = entry[0].rotate()
+        name = os.path.join(self._on_dir(experiment_id), "snapshot.pkl")
+        with open(name + ".tmp", "wb") as f:
+            pickle.dump(ledger.on_state(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(name + ".tmp", name)
+        entry[0].drop(sealed)
+        entry[1] = 0
+
+    async def recover(self, experiment_id: str, ledger: Ledger) -> int:
+        """
+            restore the snapshot into ledger and replay the tail ---> records replayed
+        """
+        name = os.path.join(self._on_dir(experiment_id), "snapshot.pkl")
+        if os.path.exists(name):
+            with open(name, "rb") as f:
+                for attr, value in pickle.load(f).items():
+                    setattr(ledger, attr, value)
+        entry = self._on_journal(experiment_id)
+        on_journal, ledger.on_journal = ledger.on_journal, None
+        replayed = 0
+        try:
+            for payload in entry[0].replay():
+                await ledger.on_replay(*pickle.loads(payload))
+                replayed += 1
+        finally:
+            ledger.on_journal = on_journal
+        entry[1] = replayed
+        return replayed
+
+    def close(self, experiment_id: str):
+        entry = self._journals.pop(self._on_key(experiment_id), None)
+        if entry is not None:
+            entry[0].close()
+
+
+class LedgerRegistry(object):
+    """
+        ledgers keyed by experiment_id, every experiment trades on its own isolated state
+        a ledger is created on first use and evicted once idle for ``idle`` seconds
+        ids are keyed by their uuid hex (same key as LedgerJournal) ---> one ledger whatever the spelling
+
+    Parameters
+    ----------
+    idle : float
+        seconds without access before a ledger is evicted
+    on_evict : callable, optional
+        called with (experiment_id, ledger) before eviction e.g. to persist a snapshot
+    journal : LedgerJournal, optional
+        journal every mutation, snapshot on eviction and recover ledgers through acquire
+    """
+    def __init__(self, idle: float = 3600, on_evict: Optional[Callable] = None, kwargs={}, 
+                 journal: Optional[LedgerJournal] = None):
+        # experiment_id hex ---> [ledger, last access], least recently used first
+        self._ledgers = OrderedDict()
+        self.idle = idle
+        self.on_evict = on_evict
+        self.kwargs = kwargs
+        self.journal = journal
+
+    @staticmethod
+    def _on_key(experiment_id: str) -> str:
+        return LedgerJournal._on_key(experiment_id)
+
+    def _on_create(self, experiment_id: str) -> Ledger:
+        # broker pops its params from kwargs
+        ledger = Ledger(dict(self.kwargs))
+        if self.journal is not None:
+            ledger.on_journal = lambda kind, record: self._on_journal(experiment_id, ledger, kind, record)
+        return ledger
+
+    def _on_journal(self, experiment_id: str, ledger: Ledger, kind: str, record):
+        if self.journal.append(experiment_id, kind, record):
+            self.journal.snapshot(experiment_id, ledger)
+
+    async def acquire(self, experiment_id: str) -> Ledger:
+        """
+            get, recovering a ledger missing from memory from its snapshot + journal tail
+        """
+        experiment_id = self._on_key(experiment_id)
+        if self.journal is None or experiment_id in self._ledgers or experiment_id not in self.journal:
+            return self.get(experiment_id)
+        ledger = self._on_create(experiment_id)
+        await self.journal.recover(experiment_id, ledger)
+        self._ledgers[experiment_id] = [ledger, time.monotonic()]
+        return ledger
+
+    def get(self, experiment_id: str) -> Ledger:
+        experiment_id = self._on_key(experiment_id)
+        self.evict()
+        try:
+            entry = self._ledgers[experiment_id]
+            self._ledgers.move_to_end(experiment_id)
+        except KeyError:
+            entry = self._ledgers[experiment_id] = [self._on_create(experiment_id), None]
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    def evict(self, now: Optional[float] = None) -> List[str]:
+        """
+            drop ledgers idle for more than self.idle seconds
+        """
+        now = time.monotonic() if now is None else now
+        evicted = []
+        while self._ledgers:
+            experiment_id, (ledger, accessed) = next(iter(self._ledgers.items()))
+            if now - accessed <= self.idle:
+                break
+            if self.on_evict is not None:
+                self.on_evict(experiment_id, ledger)
+            if self.journal is not None:
+                self.journal.snapshot(experiment_id, ledger)
+                self.journal.close(experiment_id)
+            del self._ledgers[experiment_id]
+            evicted.append(experiment_id)
+        return evicted
+
+    def remove(self, experiment_id: str):
+        del self._ledgers[self._on_key(experiment_id)]
+
+    def snapshot(self, experiment_id: str) -> bytes:
+        """
+            pickle positions, portfolio and balance of one experiment (broker is rebuilt from kwargs)
+        """
+        return pickle.dumps(self._ledgers[self._on_key(experiment_id)][0].on_state())
+
+    def restore(self, experiment_id: str, snapshot: bytes) -> Ledger:
+        experiment_id = self._on_key(experiment_id)
+        ledger = self._on_create(experiment_id)
+        for attr, value in pickle.loads(snapshot).items():
+            setattr(ledger, attr, value)
+        self._ledgers[experiment_id] = [ledger, time.monotonic()]
+        self._ledgers.move_to_end(experiment_id)
+        return ledger
+
+    def __contains__(self, experiment_id):
+        return self._on_key(experiment_id) in self._ledgers
+
+    def __len__(self):
+        return len(self._ledgers)
+
+    def __repr__(self):
+        return f"LedgerRegistry(experiments={list(self._ledgers)}, idle={self.idle})"
+
+
+def on_journal_config(environ=None) -> Optional[LedgerJournal]:
+    """
+        BT_LEDGER_JOURNAL=<directory> ---> snapshot + journal tail, positions survive a restart
+        journaling is off unless configured
+    """
+    environ = os.environ if environ is None else environ
+    path = environ.get("BT_LEDGER_JOURNAL")
+    return LedgerJournal(path) if path else None
+
+
+ledgers = LedgerRegistry(journal=on_journal_config())
@@ -18,6 +18,8 @@ class OrderMeta(BaseModel):
     price: int
     amount: int = Field(default=0)
     size: int = Field(default=0)
+    # %Y%m%d%H%M
+    created_dt: int
 
     @field_validator('direction')
     def validate_direction(cls, v):
@@ -52,7 +54,8 @@ class AccountMeta(BaseModel):
     account values as reported by the broker.
     """
     date: int
-    positions: str
+    # core.trade.codec encoded positions
+    positions: bytes
     portfolio: int
     balance: int
 
@@ -28,6 +28,8 @@ class PutOrder(BaseOrder):
     
     # using __slots__ to save on memory usage to cut down on the memory footprint of this object.
     __slots__ = ["asset", "size", "price", "order_type", "created_dt", "_status"]
+    # OrderMeta.direction, 1 buy
+    direction = 1
     
     def __init__(self, asset: Asset, size: int=0, price: int=0, created_dt='', order_type=OrderType.Market, status=OrderStatus.OPEN):
         self.asset = asset
@@ -48,6 +50,7 @@ class CallOrder(BaseOrder):
     
     # using __slots__ to save on memory usage to cut down on the memory footprint of this object.
     __slots__ = ["asset", "amount", "price", "order_type", "created_dt", "_status"]
+    direction = 0
     
     def __init__(self, asset: Asset, amount: int=0, price: int=0, created_dt='', order_type=OrderType.Market, status=OrderStatus.OPEN ):
         self.asset = asset
@@ -61,7 +64,10 @@ class CallOrder(BaseOrder):
         """
             estimeate size based on policy
         """
-        incr =  200 if self.sid.startswith("688") else 100 
+        if price <= 0:
+            # market order, price unknown until matched
+            return 0
+        incr =  200 if self.asset.sid.startswith("688") else 100 
         per_value = incr * price
         approximate = 0 if per_value > self.amount else incr * (self.amount // price)
         return approximate
@@ -72,7 +78,7 @@ class CallOrder(BaseOrder):
 
 class Transaction(object):
 
-    __slots__ = ['sid', 'amount', 'price', 'created_dt', 'cost']
+    __slots__ = ['sid', 'size', 'price', 'created_dt', 'cost']
 
     def __init__(self,
                  sid: str,
@@ -110,11 +116,18 @@ class Transaction(object):
         p_dict = {name: getattr(self, name) for name in self.__slots__}
         return p_dict
 
+    def __setstate__(self, state):
+        """
+            pickle loads --- slots without __dict__
+        """
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 def create_order(order_meta: OrderMeta):
+    asset = Asset(**order_meta.asset.model_dump())
     if order_meta.direction:
-        asset = Asset(**order_meta.asset.model_dump())
-        return PutOrder(asset, order_meta.size, order_meta.price, order_meta.created_dt, order_meta.order_type, order_meta.status)
+        return PutOrder(asset, order_meta.size, order_meta.price, order_meta.created_dt, order_meta.order_type)
     else:
-        return CallOrder(order_meta.sid, order_meta.amount, order_meta.price, order_meta.created_dt, order_meta.order_type, order_meta.status)
+        return CallOrder(asset, order_meta.amount, order_meta.price, order_meta.created_dt, order_meta.order_type)
 
@@ -6,10 +6,184 @@ Created on Tue Mar 12 15:37:47 2019
 
 @author: python
 """
+import numpy as np
 import pandas as pd
 from toolz import valmap
 
 
+class GrowableArray(object):
+    """
+        preallocated numpy buffer with amortized O(1) append (capacity doubles when full)
+        view() is the filled part without copy
+    """
+    __slots__ = ["_data", "_size"]
+
+    def __init__(self, dtype, width=None, capacity=256):
+        shape = (capacity,) if width is None else (capacity, width)
+        self._data = np.zeros(shape, dtype=dtype)
+        self._size = 0
+
+    def _reserve(self, size):
+        if size > len(self._data):
+            capacity = max(size, 2 * len(self._data))
+            data = np.zeros((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+    def append(self, value):
+        self._reserve(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        self._reserve(self._size + len(values))
+        self._data[self._size: self._size + len(values)] = values
+        self._size += len(values)
+
+    def view(self):
+        return self._data[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __getstate__(self):
+        return {"_data": self.view().copy(), "_size": self._size}
+
+    def __setstate__(self, state):
+        self._data = state["_data"]
+        self._size = state["_size"]
+
+
+class PortfolioHistory(object):
+    """
+        columnar daily history of a portfolio
+            session_ix --- int64
+            value / cash --- one (n, 2) float64 block, exported to pandas without copy
+            pnl --- long format (row, sid code, pnl) so sids may change from day to day
+    """
+    __slots__ = ["session_ix", "values", "pnl_row", "pnl_code", "pnl", "sids", "_codes"]
+
+    def __init__(self):
+        self.session_ix = GrowableArray(np.int64)
+        self.values = GrowableArray(np.float64, width=2)
+        self.pnl_row = GrowableArray(np.int64)
+        self.pnl_code = GrowableArray(np.int32)
+        self.pnl = GrowableArray(np.float64)
+        self.sids = []
+        self._codes = {}
+
+    def _on_code(self, sid):
+        try:
+            return self._codes[sid]
+        except KeyError:
+            code = self._codes[sid] = len(self.sids)
+            self.sids.append(sid)
+            return code
+
+    def append(self, session_ix, portfolio_value, cash, pnl):
+        row = len(self.session_ix)
+        self.session_ix.append(session_ix)
+        self.values.append((portfolio_value, cash))
+        self.pnl_row.extend(np.full(len(pnl), row))
+        self.pnl_code.extend([self._on_code(sid) for sid in pnl])
+        self.pnl.extend(list(pnl.values()))
+
+    def __len__(self):
+        return len(self.session_ix)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+            portfolio_value / cash indexed by session_ix, backed by the history buffer (no copy)
+        """
+        index = pd.Index(self.session_ix.view(), name="session_ix", copy=False)
+        return pd.DataFrame(self.values.view(), index=index, columns=["portfolio_value", "cash"], copy=False)
+
+    def pnl_frame(self) -> pd.DataFrame:
+        """
+            long format per sid pnl --- session_ix / sid / pnl
+        """
+        return pd.DataFrame({
+            "session_ix": self.session_ix.view()[self.pnl_row.view()],
+            "sid": pd.Categorical.from_codes(self.pnl_code.view(), categories=self.sids),
+            "pnl": self.pnl.view()
+        })
+
+
+class Exposure(object):
+    """
+        portfolio aggregates kept up to date on every fill / mark instead of recomputed at end of day
+            holding / price / cost_basis per sid, value numerator = holding * price
+            market_value --- running sum of the numerators
+            pnl --- refreshed only for sids changed since the last on_pnl
+    """
+    __slots__ = ["holding", "price", "cost_basis", "pnl", "market_value", "_dirty"]
+
+    def __init__(self):
+        self.holding = {}
+        self.price = {}
+        self.cost_basis = {}
+        self.pnl = {}
+        self.market_value = 0.0
+        self._dirty = set()
+
+    def _on_value(self, sid, holding, price):
+        self.market_value += holding * price - self.holding.get(sid, 0) * self.price.get(sid, 0.0)
+        self.holding[sid] = holding
+        self.price[sid] = price
+        self._dirty.add(sid)
+
+    def on_fill(self, sid, size, price):
+        held = self.holding.get(sid, 0)
+        if size > 0:
+            self.cost_basis[sid] = (self.cost_basis.get(sid, 0.0) * held + size * price) / (held + size)
+        self._on_value(sid, held + size, price)
+        if not self.holding[sid]:
+            for attr in (self.holding, self.price, self.cost_basis, self.pnl):
+                attr.pop(sid, None)
+            self._dirty.discard(sid)
+
+    def on_mark(self, sid, price):
+        # sids not held are ignored
+        if sid in self.holding:
+            self._on_value(sid, self.holding[sid], price)
+
+    def on_split(self, sid, size_ratio):
+        # value unchanged until the next mark, cash only dividend (ratio 1) changes nothing
+        if sid in self.holding and size_ratio != 1:
+            self.holding[sid] *= size_ratio
+            self.price[sid] /= size_ratio
+            self.cost_basis[sid] = round(self.cost_basis[sid] / size_ratio, 2)
+            self._dirty.add(sid)
+
+    def on_pnl(self):
+        """
+            return (pnl of every held sid, sids refreshed this call)
+        """
+        changed = self._dirty
+        for sid in changed:
+            cost = self.cost_basis.get(sid, 0.0)
+            self.pnl[sid] = self.price[sid] / cost - 1 if cost else 0.0
+        self._dirty = set()
+        return self.pnl, changed
+
+    def numerators(self):
+        return {sid: self.holding[sid] * self.price[sid] for sid in self.holding}
+
+    def weights(self):
+        if not self.market_value:
+            return {}
+        return {sid: value / self.market_value for sid, value in self.numerators().items()}
+
+    def rebase(self):
+        # drop float drift of the running sum
+        self.market_value = float(sum(self.numerators().values()))
+        return self.market_value
+
+    def __len__(self):
+        return len(self.holding)
+
+
 class Portfolio(object):
     """Object providing read-only access to current portfolio state.
 
@@ -23,19 +197,36 @@ class Portfolio(object):
         Dict-like object containing information about currently-held positions.
 
     """
-    __slots__ = ['initial_balance', 'pnl', 'portfolio_daily_value']
+    __slots__ = ['initial_balance', 'history', 'exposure']
 
     def __init__(self, balance):
         self.initial_balance = balance
-        self.portfolio_daily_value = pd.Series(dtype='float64')
-        self.pnl = pd.Series(dtype="float64")
+        self.history = PortfolioHistory()
+        self.exposure = Exposure()
 
-    def calc_portfolio(self, session_ix, positions):
-        portfolio_value = sum([p["price"] * p["size"] for p in positions])
-        self.portfolio_daily_value[session_ix] = portfolio_value
-        pnl = valmap(lambda p: p["price"] / p["cost_basis"] -1 , positions)
-        self.pnl[session_ix] = pnl
-        return portfolio_value, pnl, portfolio_value / self.balance
+    @property
+    def portfolio_daily_value(self) -> pd.Series:
+        return self.history.to_frame()["portfolio_value"]
+
+    @property
+    def pnl(self) -> pd.DataFrame:
+        return self.history.pnl_frame()
+
+    def calc_portfolio(self, session_ix, positions, cash=0.0):
+        portfolio_value = sum([p["price"] * p["size"] for p in positions.values()])
+        pnl = valmap(lambda p: p["price"] / p["cost_basis"] - 1 if p["cost_basis"] else 0.0, positions)
+        self.history.append(session_ix, portfolio_value, cash, pnl)
+        return portfolio_value, pnl, portfolio_value / self.initial_balance
+
+    def on_session(self, session_ix, cash=0.0):
+        """
+            close a session from the incremental exposure, only sids whose pnl changed are
+            refreshed and recorded (pnl_frame is sparse, forward fill for a dense panel)
+        """
+        portfolio_value = self.exposure.market_value
+        pnl, changed = self.exposure.on_pnl()
+        self.history.append(session_ix, portfolio_value, cash, {sid: pnl[sid] for sid in changed})
+        return portfolio_value, pnl, portfolio_value / self.initial_balance
 
     def current_portfolio_weights(self, positions):
         """
@@ -46,8 +237,8 @@ class Portfolio(object):
         futures contract's value is its unit price times number of shares held
         times the multiplier.
         """
-        if self.positions:
-            p_objs = valmap(lambda p:  p.price * p.size, positions)
+        if positions:
+            p_objs = valmap(lambda p:  p["price"] * p["size"], positions)
             aggregate = sum(p_objs.values())
             weights = pd.Series(p_objs) / aggregate
         else:
@@ -71,5 +262,4 @@ class Portfolio(object):
 
     def __repr__(self):
         return f"Portfolio(initial_balance={self.initial_balance}, \
-        portfolio_daily_value={self.portfolio_daily_value}, \
-        pnl={self.pnl})"
\ No newline at end of file
+        sessions={len(self.history)})"
\ No newline at end of file
@@ -22,6 +22,7 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 from copy import copy
+import numpy as np
 from deprecated import deprecated
 from warnings import warn
 from toolz import valmap
@@ -251,12 +252,9 @@ class PositionTracker(object):
             根据深圳证券交易所交易规则,投资者的红股在R+3日自动到账,并可进行交易,股息在R+5日自动到账
             持股超过1年 税负5%; 持股1个月至1年 税负10%; 持股1个月以内 税负20%新政实施后,上市公司会先按照5%的最低税率代缴红利税
         """
-        try:
-            size_ratio = (dividend['sid_bonus'] + dividend['sid_transfer']) / 10
-            bonus_ratio = dividend['bonus'] / 10
-        except ZeroDivisionError:
-            size_ratio = 1.0
-            bonus_ratio = 0.0
+        # bonus / transfer shares per 10 held on top of the held ones, cash only dividend ---> 1.0
+        size_ratio = 1 + (dividend['sid_bonus'] + dividend['sid_transfer']) / 10
+        bonus_ratio = dividend['bonus'] / 10
         return size_ratio, bonus_ratio
 
     async def _on_split(self, dividends: Mapping[str, Any]):
@@ -312,6 +310,9 @@ class PositionTracker(object):
         for p_obj in self.positions.values():
             await p_obj.on_last_sync(prices[p_obj.sid], dt)
 
+    async def syncronize_arrays(self, sids: List[str], closes, dt: int):
+        await self.syncronize(dict(zip(sids, closes.tolist())), dt)
+
     def _cleanup_expired(self, dt: int):
         """
             Clear out any assets that have expired before starting a new sim day.
@@ -333,3 +334,175 @@ class PositionTracker(object):
         # return protocol mappings
         protocols = valmap(lambda x: x.to_dict(), self.positions)
         return protocols
+
+    def get_arrays(self):
+        """
+            (sids, size, avaiable, cost_basis, price) for the columnar positions encoding
+        """
+        positions = self.get_positions()
+        sids = list(positions)
+        return (sids,) + tuple([positions[sid][name] for sid in sids] for name in ("size", "avaiable", "cost_basis", "price"))
+
+
+class ArrayPositionTracker(object):
+    """
+        columnar PositionTracker --- parallel numpy arrays with a sid to row index
+        same update / syncronize / process_event / get_positions api, but end of day sync,
+        splits and weights run as single vectorized operations over all rows
+
+        buys are available on T+1 (after syncronize), sells reduce avaiable at once
+    """
+    columns = (("size", "float64"), ("avaiable", "float64"), ("cost_basis", "float64"),
+               ("price", "float64"), ("upopened", "float64"), ("upclosed", "float64"))
+
+    def __init__(self, capacity=64):
+        self.sids = []
+        self.index = {}
+        self.record_closed_position = defaultdict(list)
+        self.last_sync_date = 0
+        for name, dtype in self.columns:
+            setattr(self, "_" + name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return len(self.sids)
+
+    def __contains__(self, sid):
+        return sid in self.index
+
+    def __getattr__(self, item):
+        # live view of column ``item`` e.g. tracker.size
+        if item in dict(self.columns):
+            return getattr(self, "_" + item)[:len(self.sids)]
+        raise AttributeError(item)
+
+    def _on_row(self, sid) -> int:
+        try:
+            return self.index[sid]
+        except KeyError:
+            row = len(self.sids)
+            if row == len(self._size):
+                for name, _ in self.columns:
+                    arr = getattr(self, "_" + name)
+                    setattr(self, "_" + name, np.concatenate([arr, np.zeros_like(arr)]))
+            for name, _ in self.columns:
+                getattr(self, "_" + name)[row] = 0
+            self.sids.append(sid)
+            self.index[sid] = row
+            return row
+
+    def _on_remove(self, sid):
+        # swap with the last row to keep columns dense
+        row = self.index.pop(sid)
+        last = len(self.sids) - 1
+        if row != last:
+            for name, _ in self.columns:
+                arr = getattr(self, "_" + name)
+                arr[row] = arr[last]
+            self.sids[row] = self.sids[last]
+            self.index[self.sids[row]] = row
+        self.sids.pop()
+
+    async def update(self, txns: List[TransactionMeta]):
+        for txn in txns:
+            row = self._on_row(txn.sid)
+            holding = self._size[row] + self._upopened[row] - self._upclosed[row]
+            if txn.size > 0:
+                self._cost_basis[row] = (self._cost_basis[row] * holding + txn.size * txn.price) / (holding + txn.size)
+                self._upopened[row] += txn.size
+            else:
+                assert self._avaiable[row] + txn.size >= 0, "not supported short position"
+                self._avaiable[row] += txn.size
+                self._upclosed[row] -= txn.size
+
+            if holding + txn.size == 0:
+                dts = txn.created_dt.strftime('%Y-%m-%d')
+                self.record_closed_position[dts].append(self._on_serialize(row))
+                self._on_remove(txn.sid)
+
+    async def syncronize(self, prices: Mapping[str, float], dt: int):
+        """
+            T+1 roll forward, available reset and close price marking of every row at once
+            sids missing in prices keep their last price
+        """
+        closes = np.fromiter((prices.get(sid, np.nan) for sid in self.sids), dtype=np.float64, count=len(self.sids))
+        self._on_sync(closes, dt)
+
+    async def syncronize_arrays(self, sids: List[str], closes: np.ndarray, dt: int):
+        """
+            closes aligned with sids (float64), no per position mapping lookup when sids
+            come in tracker row order e.g. from a previous get_positions
+        """
+        if sids == self.sids:
+            self._on_sync(closes, dt)
+            return
+        rows = np.fromiter((self.index.get(sid, -1) for sid in sids), dtype=np.int64, count=len(sids))
+        mask = rows >= 0
+        aligned = np.full(len(self.sids), np.nan)
+        aligned[rows[mask]] = closes[mask]
+        self._on_sync(aligned, dt)
+
+    def _on_sync(self, closes: np.ndarray, dt: int):
+        n = len(self.sids)
+        size = self._size[:n]
+        size += self._upopened[:n] - self._upclosed[:n]
+        self._avaiable[:n] = size
+        np.copyto(self._price[:n], closes, where=~np.isnan(closes))
+        self._upopened[:n] = 0
+        self._upclosed[:n] = 0
+        self.last_sync_date = dt
+
+    async def _on_split(self, dividends: Mapping[str, Any]):
+        rows = [self.index[sid] for sid in dividends if sid in self.index]
+        if not rows:
+            return 0
+        ratios = np.array([PositionTracker._calc_ratio(dividends[self.sids[row]]) for row in rows])
+        size_ratio, bonus_ratio = ratios[:, 0], ratios[:, 1]
+        rows = np.asarray(rows)
+        oldsize = self._size[rows]
+        self._size[rows] = oldsize * size_ratio
+        self._avaiable[rows] = self._avaiable[rows] * size_ratio
+        self._cost_basis[rows] = np.round(self._cost_basis[rows] / size_ratio, 2)
+        return float(np.sum(oldsize * bonus_ratio))
+
+    async def process_event(self, event: EquityEvent):
+        if event.event_type == "split":
+            data = await self._on_split(event.meta)
+        else:
+            warn("best practice is to use position on_update instead", UserWarning)
+            data = 0
+        return data
+
+    def weights(self) -> Mapping[str, float]:
+        """
+            held value of every sid over the value of all positions
+        """
+        values = self.size * self.price
+        aggregate = np.sum(values)
+        if not aggregate:
+            return {}
+        return dict(zip(self.sids, (values / aggregate).tolist()))
+
+    def _on_serialize(self, row):
+        return {
+            'sid': self.sids[row],
+            'size': float(self._size[row]),
+            'price': float(self._price[row]),
+            'cost_basis': float(self._cost_basis[row]),
+            'avaiable': float(self._avaiable[row]),
+            }
+
+    def get_positions(self):
+        # return protocol mappings
+        return {sid: self._on_serialize(row) for row, sid in enumerate(self.sids)}
+
+    def get_arrays(self):
+        """
+            (sids, size, avaiable, cost_basis, price) column views, no per row dict
+        """
+        return self.sids, self.size, self.avaiable, self.cost_basis, self.price
+
+
+tracker_factory = {
+    "object": PositionTracker,
+    "columnar": ArrayPositionTracker
+}
@@ -1,4 +1,6 @@
 # gunicorn.conf.py
+# ledgers live in worker memory and gunicorn balances requests regardless of experiment,
+# run ``python -m web.dispatch --workers 4 --port 11000`` for sticky experiment routing
 workers = 4
 worker_class = "uvicorn.workers.UvicornWorker"
 bind = "0.0.0.0:11000"
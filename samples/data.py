@@ -1,17 +1,18 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
-import pdb
+import asyncio
 import pandas as pd
 from core.ops.operator import async_ops
 
-def get_data(req: str):
-    df = async_ops.on_query(req)
-    return df
+
+async def get_data(req: str, batch_size: int = 50000):
+    # column batches from a server side cursor ---> one concat, no per row objects
+    frames = [pd.DataFrame(batch) async for batch in async_ops.on_query_batch(req, batch_size=batch_size)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 
 if __name__ == "__main__":
 
     req = "select * from minute where sid = 603676"
-    raw = get_data(req)
-    pdb.set_trace()
-    print(raw)
\ No newline at end of file
+    raw = asyncio.run(get_data(req))
+    print(raw)
@@ -0,0 +1,55 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import MetaData, PrimaryKeyConstraint
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from core.ops.operator import async_ops
+from core.ops.schema import Base, User, Token, Experiment
+from core.trade.ledger import LedgerRegistry
+from web import login, trade, stats
+
+
+@pytest.fixture
+def patch_app(monkeypatch):
+    """
+        in process user / trade / stats routers on sqlite, one user owning one experiment + a foreign experiment
+    """
+    engine = create_async_engine("sqlite+aiosqlite://")
+    session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    metadata = MetaData()
+    for name in ("user_info", "token", "experiment", "_order", "transaction", "order_transaction", "account"):
+        Base.metadata.tables[name].to_metadata(metadata)
+    # sqlite only autoincrements a single column key ---> (id, order_id) / (id, transaction_id) become id
+    for name, key in (("_order", "order_id"), ("transaction", "transaction_id")):
+        table = metadata.tables[name]
+        table.c[key].primary_key = False
+        table.primary_key = PrimaryKeyConstraint(table.c.id)
+
+    async def _create():
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+        async with session_factory() as session:
+            user, other = User(name="test", phone=1), User(name="other", phone=2)
+            token = Token(user=user)
+            experiment, foreign = Experiment(user=user), Experiment(user=other)
+            session.add_all([user, other, token, experiment, foreign])
+            await session.commit()
+            return str(token.token), str(experiment.experiment_id), str(foreign.experiment_id)
+    token, experiment_id, foreign_id = asyncio.run(_create())
+
+    monkeypatch.setattr(async_ops, "_initialized", True, raising=False)
+    monkeypatch.setattr(async_ops, "engine", engine, raising=False)
+    monkeypatch.setattr(async_ops, "session_factory", session_factory, raising=False)
+    monkeypatch.setattr(trade, "ledgers", LedgerRegistry())
+    login.user_cache.clear()
+    app = FastAPI()
+    app.include_router(login.router, prefix="/user")
+    app.include_router(trade.router, prefix="/trade")
+    app.include_router(stats.router, prefix="/stats")
+    yield TestClient(app, raise_server_exceptions=False), trade.ledgers, token, experiment_id, foreign_id
+    login.user_cache.clear()
+    asyncio.run(engine.dispose())
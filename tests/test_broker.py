@@ -0,0 +1,198 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import datetime
+import numpy as np
+import pytest
+from core.broker.broker import BtBroker
+from core.broker.tick import TickSession
+from core.trade.asset import Asset
+from core.trade.order import PutOrder, CallOrder, Transaction
+
+
+class TestDownsample:
+
+    @pytest.fixture
+    def patch_minutes(self):
+        rng = np.random.default_rng(7)
+        close = 10 + np.cumsum(rng.normal(0, 0.01, 240))
+        open_ = np.r_[close[0], close[:-1]]
+        high = np.maximum(open_, close) + 0.01
+        low = np.minimum(open_, close) - 0.01
+        volume = rng.integers(1000, 10000, 240).astype(np.float64)
+        return np.column_stack([open_, high, low, close, volume])
+
+    def test_batch_shape(self, patch_minutes):
+        broker = BtBroker({})
+        prices, vols = broker.downsample(patch_minutes)
+        assert prices.shape == (4800,)
+        assert vols.shape == (4800,)
+        np.testing.assert_allclose(vols.reshape(240, 20).sum(axis=1), patch_minutes[:, 4])
+
+    def test_batch_align(self, patch_minutes):
+        broker = BtBroker({})
+        prices, _ = broker.downsample(patch_minutes)
+        ticks = prices.reshape(240, 20)
+        np.testing.assert_allclose(ticks[:, 0], patch_minutes[:, 0])
+        np.testing.assert_allclose(ticks[:, -1], patch_minutes[:, 3])
+        np.testing.assert_allclose(ticks.max(axis=1), patch_minutes[:, 1])
+        np.testing.assert_allclose(ticks.min(axis=1), patch_minutes[:, 2])
+
+    def test_batch_equals_minute(self, patch_minutes):
+        batch = BtBroker({"dist": "linear"}).downsample(patch_minutes)
+        minute = BtBroker({"dist": "linear", "synthesis": "minute"}).downsample(patch_minutes)
+        np.testing.assert_allclose(batch[0], minute[0])
+        np.testing.assert_allclose(batch[1], minute[1])
+
+
+class TestTickCache:
+
+    @pytest.fixture
+    def patch_minutes(self):
+        block = np.tile([10.0, 10.2, 9.9, 10.1, 1000.0], (240, 1))
+        return block
+
+    def test_repeat_hit(self, patch_minutes):
+        broker = BtBroker({})
+        first = broker.downsample(patch_minutes, "600001", 20240102)
+        second = broker.downsample(patch_minutes, "600001", 20240102)
+        assert first is second
+        assert broker.tick_cache.info()["hits"] == 1
+        assert broker.tick_cache.info()["misses"] == 1
+        assert not first[0].flags.writeable
+
+    def test_minutes_changed(self, patch_minutes):
+        broker = BtBroker({})
+        first = broker.downsample(patch_minutes, "600001", 20240102)
+        # partial session then corrected minutes ---> same sid / session, different ticks
+        partial = broker.downsample(patch_minutes[:120], "600001", 20240102)
+        corrected = patch_minutes.copy()
+        corrected[-1, 3] = 10.3
+        last = broker.downsample(corrected, "600001", 20240102)
+        assert broker.tick_cache.info()["misses"] == 3
+        assert len(partial[0]) < len(first[0]) and last is not first
+
+    def test_bounded(self, patch_minutes):
+        broker = BtBroker({"cache_size": 2})
+        for session in (20240102, 20240103, 20240104):
+            broker.downsample(patch_minutes, "600001", session)
+        assert len(broker.tick_cache) == 2
+        broker.downsample(patch_minutes, "600001", 20240102)
+        assert broker.tick_cache.info()["misses"] == 4
+
+
+class TestSeed:
+
+    @pytest.fixture
+    def patch_minutes(self):
+        return np.tile([10.0, 10.2, 9.9, 10.1, 1000.0], (240, 1))
+
+    def test_replay(self, patch_minutes):
+        first = BtBroker({"seed": 42}).downsample(patch_minutes, "600001", 20240102)
+        second = BtBroker({"seed": 42}).downsample(patch_minutes, "600001", 20240102)
+        np.testing.assert_array_equal(first[0], second[0])
+
+    def test_order_independent(self, patch_minutes):
+        broker = BtBroker({"seed": 42})
+        broker.downsample(patch_minutes, "600002", 20240102)
+        first = broker.downsample(patch_minutes, "600001", 20240102)
+        second = BtBroker({"seed": 42}).downsample(patch_minutes, "600001", 20240102)
+        np.testing.assert_array_equal(first[0], second[0])
+
+    def test_streams_differ(self, patch_minutes):
+        broker = BtBroker({"seed": 42})
+        first = broker.downsample(patch_minutes, "600001", 20240102)
+        second = broker.downsample(patch_minutes, "600001", 20240103)
+        assert not np.array_equal(first[0], second[0])
+
+
+class TestFirstTouch:
+
+    def test_equals_argwhere(self):
+        rng = np.random.default_rng(3)
+        prices = 10 + np.cumsum(rng.normal(0, 0.01, 4800))
+        limits = rng.uniform(prices.min() - 0.05, prices.max() + 0.05, 200)
+        directions = rng.integers(0, 2, 200)
+        locs = TickSession(prices, np.ones_like(prices)).first_touch(limits, directions)
+        for limit, direction, loc in zip(limits, directions, locs):
+            hits = np.argwhere(prices <= limit) if direction == 1 else np.argwhere(prices >= limit)
+            expected = hits[0][0] if len(hits) else len(prices)
+            assert loc == expected
+
+    def test_scalar(self):
+        session = TickSession(np.array([10.0, 9.8, 10.3, 9.5]), np.ones(4))
+        assert session.first_touch(9.9, 1) == 1
+        assert session.first_touch(10.1, 0) == 2
+        assert session.first_touch(9.0, 1) == len(session)
+        # searched from the tick the order was created at
+        assert session.first_touch(9.9, 1, 2) == 3
+        assert session.first_touch(10.1, 0, 3) == len(session)
+
+    def test_starts_equal_argwhere(self):
+        rng = np.random.default_rng(5)
+        prices = 10 + np.cumsum(rng.normal(0, 0.01, 4800))
+        limits = rng.uniform(prices.min() - 0.05, prices.max() + 0.05, 200)
+        directions = rng.integers(0, 2, 200)
+        starts = rng.integers(0, 4801, 200)
+        locs = TickSession(prices, np.ones_like(prices)).first_touch(limits, directions, starts)
+        for limit, direction, start, loc in zip(limits, directions, starts, locs):
+            tail = prices[start:]
+            hits = np.argwhere(tail <= limit) if direction == 1 else np.argwhere(tail >= limit)
+            expected = start + hits[0][0] if len(hits) else len(prices)
+            assert loc == expected
+
+
+class TestMatchBatch:
+
+    @pytest.fixture
+    def patch_orders(self):
+        asset = Asset("600001", 20100101)
+        return [PutOrder(asset, size=1000, created_dt=202401020930, order_type=4),
+                PutOrder(asset, size=1000, price=9.0, created_dt=202401020930, order_type=1),
+                PutOrder(asset, size=1000, price=10.0, created_dt=202401020930, order_type=1),
+                CallOrder(asset, amount=10 ** 6, price=10.0, created_dt=202401020930, order_type=1)]
+
+    @pytest.fixture
+    def patch_minutes(self):
+        return np.tile([10.0, 10.2, 9.9, 10.1, 1000.0], (240, 1))
+
+    def test_transactions(self, patch_orders, patch_minutes):
+        broker = BtBroker({"seed": 42})
+        txns = asyncio.run(broker.match_batch(patch_orders, patch_minutes))
+        market, untouched, buy, sell = txns
+        assert untouched == ''
+        for txn in (market, buy, sell):
+            assert isinstance(txn, Transaction) and txn.sid == "600001"
+            # impact bounded by the tick volume
+            assert 0 < txn.size <= 1000 and txn.cost > 0
+        # 9:30 market order deals after the delay
+        assert market.created_dt == datetime.datetime(2024, 1, 2, 9, 30, 6)
+        session = broker.downsample(patch_minutes, "600001", 20240102)
+        loc = int(session.first_touch(10.0, 1))
+        assert buy.created_dt == datetime.datetime(2024, 1, 2, 9, 30) + datetime.timedelta(seconds=3 * (loc + 2))
+
+    def test_created_afternoon(self, patch_orders, patch_minutes):
+        broker = BtBroker({"seed": 42})
+        session = broker.downsample(patch_minutes, "600001", 20240102)
+        # touched in the morning already ---> a 14:00 order fills after 14:00, never before it existed
+        limit = float(session.prices.max())
+        assert int(session.first_touch(limit, 1)) < broker.on_loc(202401021400)
+        order = PutOrder(patch_orders[0].asset, size=1000, price=limit, created_dt=202401021400, order_type=1)
+        txn, = asyncio.run(broker.match_batch([order], patch_minutes))
+        assert txn.created_dt >= datetime.datetime(2024, 1, 2, 14, 0)
+        single = asyncio.run(broker.on_trade(order, patch_minutes))
+        assert single.created_dt == txn.created_dt
+
+    def test_same_session(self, patch_orders, patch_minutes):
+        other = PutOrder(Asset("600002", 20100101), size=100, created_dt=202401020930, order_type=4)
+        with pytest.raises(ValueError):
+            asyncio.run(BtBroker({}).match_batch(patch_orders + [other], patch_minutes))
+        later = PutOrder(patch_orders[0].asset, size=100, created_dt=202401030930, order_type=4)
+        with pytest.raises(ValueError):
+            asyncio.run(BtBroker({}).match_batch(patch_orders + [later], patch_minutes))
+
+    def test_delisted(self, patch_orders, patch_minutes):
+        delisted = Asset("600001", 20100101, delist=20231229)
+        orders = [PutOrder(delisted, size=1000, created_dt=202401020930, order_type=4)]
+        assert asyncio.run(BtBroker({}).match_batch(orders, patch_minutes)) == ['']
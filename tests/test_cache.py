@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+from utils.cache import AsyncTTLCache, SingleFlight
+
+
+class TestAsyncTTLCache:
+
+    @pytest.fixture
+    def patch_cache(self):
+        now = [0.0]
+        cache = AsyncTTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        return cache, now
+
+    def test_ttl_lru(self, patch_cache):
+        cache, now = patch_cache
+        calls = []
+
+        async def _load(key):
+            calls.append(key)
+            return key.upper()
+
+        async def _run():
+            assert await cache.get("a", _load, "a") == "A"
+            assert await cache.get("a", _load, "a") == "A"
+            await cache.get("b", _load, "b")
+            await cache.get("c", _load, "c")
+            # a evicted as least recently used
+            assert "a" not in cache and len(cache) == 2
+            now[0] = 11
+            # b expired
+            await cache.get("b", _load, "b")
+        asyncio.run(_run())
+        assert calls == ["a", "b", "c", "b"]
+        assert cache.info()["hits"] == 1 and cache.info()["misses"] == 4
+
+    def test_single_flight(self, patch_cache):
+        cache, _ = patch_cache
+        calls = []
+
+        async def _load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "user"
+
+        async def _run():
+            return await asyncio.gather(*[cache.get("token", _load) for _ in range(10)])
+        assert asyncio.run(_run()) == ["user"] * 10
+        assert len(calls) == 1
+        assert cache.info()["coalesced"] == 9
+
+    def test_error_invalidate(self, patch_cache):
+        cache, _ = patch_cache
+
+        async def _fail():
+            raise KeyError("token")
+
+        async def _slow():
+            await asyncio.sleep(0.01)
+            return "stale"
+
+        async def _run():
+            with pytest.raises(KeyError):
+                await cache.get("token", _fail)
+            # loader errors are not cached
+            assert "token" not in cache
+            task = asyncio.ensure_future(cache.get("token", _slow))
+            await asyncio.sleep(0)
+            cache.invalidate("token")
+            # invalidated while loading ---> result returned but not stored
+            assert await task == "stale"
+            assert "token" not in cache
+        asyncio.run(_run())
+
+
+class TestSingleFlight:
+
+    def test_cancel(self):
+        async def _load():
+            await asyncio.sleep(0.01)
+            return 1
+
+        async def _run():
+            flight = SingleFlight()
+            first = asyncio.ensure_future(flight.do("k", _load))
+            second = asyncio.ensure_future(flight.do("k", _load))
+            await asyncio.sleep(0)
+            first.cancel()
+            # the shared load survives a cancelled caller
+            return await second, len(flight)
+        assert asyncio.run(_run()) == (1, 0)
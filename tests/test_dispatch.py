@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import uuid
+import time
+import threading
+import pytest
+import uvicorn
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from web.dispatch import Dispatcher
+
+
+def on_scope(path="/trade/on_event", query=b""):
+    return {"type": "http", "path": path, "query_string": query}
+
+
+class TestDispatcher:
+
+    @pytest.fixture
+    def patch_dispatcher(self, tmp_path):
+        return Dispatcher([str(tmp_path / f"worker_{ix}.sock") for ix in range(4)])
+
+    def test_on_experiment(self):
+        body = json.dumps({"experiment_id": "exp-1"}).encode()
+        assert Dispatcher.on_experiment(on_scope(query=b"token=t&experiment_id=exp-2"), body) == "exp-2"
+        assert Dispatcher.on_experiment(on_scope(), body) == "exp-1"
+        # batch ---> first item
+        batch = json.dumps([{"experiment_id": "exp-3"}, {"experiment_id": "exp-3"}]).encode()
+        assert Dispatcher.on_experiment(on_scope(), batch) == "exp-3"
+        assert Dispatcher.on_experiment(on_scope("/stats/ws/feed/exp-4", b"token=t"), b"") == "exp-4"
+        for body in (b"", b"[]", b"not json", json.dumps({"token": "t"}).encode()):
+            assert Dispatcher.on_experiment(on_scope(), body) is None
+
+    def test_route(self, patch_dispatcher):
+        experiment_ids = [str(uuid.UUID(int=ix * 7919 + 1)) for ix in range(100)]
+        ixs = {patch_dispatcher.route(experiment_id) for experiment_id in experiment_ids}
+        assert ixs == {0, 1, 2, 3}
+        # sticky per experiment, whatever the spelling
+        experiment_id = experiment_ids[1]
+        spellings = (experiment_id, experiment_id.upper(), uuid.UUID(experiment_id).hex)
+        assert len({patch_dispatcher.route(spelling) for spelling in spellings for _ in range(10)}) == 1
+        # malformed ids ---> one fixed worker
+        assert {patch_dispatcher.route(f"exp-{ix}") for ix in range(10)} == {0}
+        # no experiment ---> round robin
+        assert [patch_dispatcher.route(None) for _ in range(5)] == [0, 1, 2, 3, 0]
+
+
+class TestWebsocketProxy:
+
+    @pytest.fixture
+    def patch_worker(self, tmp_path):
+        app = FastAPI()
+
+        @app.websocket("/stats/ws/feed/{experiment_id}")
+        async def feed_endpoint(websocket: WebSocket, experiment_id: str, token: str):
+            if token != "t":
+                await websocket.close(code=1008)
+                return
+            await websocket.accept()
+            await websocket.send_text(f"feed {experiment_id}")
+            await websocket.send_text(await websocket.receive_text())
+
+        path = str(tmp_path / "worker.sock")
+        server = uvicorn.Server(uvicorn.Config(app, uds=path, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        yield path
+        server.should_exit = True
+        thread.join()
+
+    def test_feed(self, patch_worker):
+        client = TestClient(Dispatcher([patch_worker]))
+        with client.websocket_connect("/stats/ws/feed/exp-1?token=t") as ws:
+            assert ws.receive_text() == "feed exp-1"
+            ws.send_text("ping")
+            assert ws.receive_text() == "ping"
+        # rejected by the worker ---> rejected by the dispatcher
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/stats/ws/feed/exp-1?token=bad") as ws:
+                ws.receive_text()
+        assert exc.value.code == 1008
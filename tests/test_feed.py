@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import datetime
+import json
+import uuid
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from core.trade.ledger import Ledger
+from core.trade.order import Transaction
+from web.feed import FeedHub, LatestQueue, feed
+from web.stats import ConnectionManager
+
+
+class TestLatestQueue:
+
+    def test_coalesce(self):
+        async def _run():
+            queue = LatestQueue(maxsize=2)
+            queue.put("portfolio", "v1")
+            queue.put("portfolio", "v2")
+            queue.put("a", "a1")
+            queue.put("b", "b1")
+            return [await queue.get(), await queue.get()], queue.dropped
+        messages, dropped = asyncio.run(_run())
+        # portfolio coalesced to v2 then evicted as the oldest key
+        assert messages == ["a1", "b1"]
+        assert dropped == 2
+
+
+class TestFeedHub:
+
+    @pytest.fixture
+    def patch_ledger(self):
+        ledger = Ledger({"tracker": "columnar"})
+        txn = Transaction(sid="600001", size=100, price=10.0, cost=0,
+                          created_dt=datetime.datetime(2024, 1, 2, 10, 0))
+        asyncio.run(ledger._on_fill(txn))
+        return ledger, txn
+
+    def test_publish(self, patch_ledger):
+        ledger, txn = patch_ledger
+        async def _run():
+            hub = FeedHub()
+            queue = hub.subscribe("exp-1")
+            other = hub.subscribe("exp-2")
+            hub.on_ledger("exp-1", ledger, [txn])
+            hub.on_ledger("exp-1", ledger, [txn])
+            messages = [json.loads(await queue.get()) for _ in range(len(queue))]
+            return messages, len(other)
+        messages, other = asyncio.run(_run())
+        assert [m["type"] for m in messages] == ["fill", "position", "portfolio", "fill"]
+        assert messages[1]["holding"] == 100
+        assert other == 0
+
+
+class FakeWebSocket:
+
+    def __init__(self, stall=False):
+        self.stall = stall
+        self.received = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.stall:
+            await asyncio.sleep(3600)
+        self.received.append(message)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+class TestConnectionManager:
+
+    def test_slow_consumer_evicted(self):
+        async def _run():
+            manager = ConnectionManager(maxsize=4)
+            fast, slow = FakeWebSocket(), FakeWebSocket(stall=True)
+            await manager.connect(fast)
+            await manager.connect(slow)
+            for ix in range(10):
+                await manager.broadcast({"ix": ix})
+                await asyncio.sleep(0.001)
+            await asyncio.sleep(0.01)
+            return manager, fast, slow
+        manager, fast, slow = asyncio.run(_run())
+        assert len(fast.received) == 10
+        assert slow not in manager.active_connections
+        assert slow.closed == 1013
+        assert manager.evicted == 1
+
+
+class TestFeedEndpoint:
+
+    def test_owner_only(self, patch_app):
+        client, _, token, experiment_id, foreign_id = patch_app
+        for experiment, user_token in ((foreign_id, token), (experiment_id, "not-a-token")):
+            with pytest.raises(WebSocketDisconnect) as exc:
+                with client.websocket_connect(f"/stats/ws/feed/{experiment}?token={user_token}") as ws:
+                    ws.receive_text()
+            assert exc.value.code == 1008
+            assert not feed._subscribers.get(experiment)
+        with client.websocket_connect(f"/stats/ws/feed/{experiment_id}?token={token}"):
+            pass
+
+
+class TestStatsEndpoint:
+
+    def test_on_stats(self, patch_app):
+        client, _, token, experiment_id, foreign_id = patch_app
+        event = {"session_ix": 20240102, "meta": {}, "token": token, "experiment_id": experiment_id}
+        assert client.post("/trade/on_sync", json=event).status_code == 200
+        query = {"start_dt": 20240101, "end_dt": 20240131, "token": token, "experiment_id": experiment_id.upper()}
+        resp = client.request("GET", "/stats/on_stats", json=query)
+        assert resp.status_code == 200
+        assert [row["date"] for row in resp.json()] == [20240102]
+        assert resp.json()[0]["positions"]["sid"] == []
+        # foreign experiment / unknown token
+        assert client.request("GET", "/stats/on_stats", json=dict(query, experiment_id=foreign_id)).status_code == 404
+        assert client.request("GET", "/stats/on_stats", json=dict(query, token=uuid.uuid4().hex)).status_code == 401
+
@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import uuid
+import asyncio
+import datetime
+import pytest
+import base64
+import numpy as np
+from core.event import SyncEvent, SyncArrayEvent, TradeEvent, EquityEvent
+from core.trade.ledger import LedgerRegistry, LedgerJournal, on_journal_config
+from core.trade.order import Transaction
+from core.trade.position import ArrayPositionTracker
+
+EXPERIMENT_ID = "b6e33fc9-8b78-4e0c-b061-31777aa9c8de"
+FIRST, SECOND = "0f8e4a52-5f0b-4c37-9a57-3d1b8c0e6a11", "5c2d9b7e-1a43-4e8f-b6d0-7e9f2a4c8b22"
+
+
+class TestLedgerRegistry:
+
+    @pytest.fixture
+    def patch_registry(self):
+        return LedgerRegistry(idle=60)
+
+    def test_isolated(self, patch_registry):
+        first = patch_registry.get(FIRST)
+        second = patch_registry.get(SECOND)
+        assert first is not second
+        assert patch_registry.get(FIRST) is first
+        assert first._broker is not second._broker
+        assert isinstance(first.position_tracker, ArrayPositionTracker)
+
+    def test_evict(self, patch_registry):
+        evicted = []
+        patch_registry.on_evict = lambda experiment_id, ledger: evicted.append(experiment_id)
+        patch_registry.get(FIRST)
+        patch_registry.get(SECOND)
+        assert patch_registry.evict(now=10 ** 12) == [uuid.UUID(FIRST).hex, uuid.UUID(SECOND).hex]
+        assert evicted == [uuid.UUID(FIRST).hex, uuid.UUID(SECOND).hex]
+        assert FIRST not in patch_registry
+
+    def test_snapshot_restore(self, patch_registry):
+        ledger = patch_registry.get(FIRST)
+        ledger.avaiable = 12345
+        blob = patch_registry.snapshot(FIRST)
+        patch_registry.remove(FIRST)
+        restored = patch_registry.restore(FIRST, blob)
+        assert restored.avaiable == 12345
+        assert patch_registry.get(FIRST) is restored
+
+    def test_spelling(self, patch_registry):
+        ledger = patch_registry.get(FIRST)
+        # upper case / no hyphens ---> the same ledger, hence the same journal
+        assert patch_registry.get(FIRST.upper()) is ledger
+        assert patch_registry.get(uuid.UUID(FIRST).hex) is ledger
+        assert len(patch_registry) == 1 and FIRST.upper() in patch_registry
+        with pytest.raises(ValueError):
+            patch_registry.get("exp-1")
+
+
+class TestLedgerJournal:
+
+    @pytest.fixture
+    def patch_journal(self, tmp_path):
+        return lambda: LedgerRegistry(kwargs={"tracker": "columnar"},
+                                      journal=LedgerJournal(str(tmp_path), snapshot_every=4))
+
+    def test_recover(self, patch_journal):
+        async def _run():
+            registry = patch_journal()
+            ledger = await registry.acquire(EXPERIMENT_ID)
+            for ix in range(5):
+                txn = Transaction(sid=f"60000{ix % 2}", size=100, price=10.0 + ix, cost=0,
+                                  created_dt=datetime.datetime(2024, 1, 2, 10, ix))
+                await ledger._on_fill(txn)
+            await ledger.on_end_of_day(SyncEvent(session_ix=20240102, meta={"600000": 11.0, "600001": 12.0},
+                                                 token="t", experiment_id=EXPERIMENT_ID))
+            state = (ledger.avaiable, ledger.portfolio.portfolio_daily_value.tolist(),
+                     ledger.position_tracker.get_positions())
+            # process restart ---> fresh registry on the same directory
+            restarted = patch_journal()
+            recovered = await restarted.acquire(EXPERIMENT_ID)
+            replayed = restarted.journal._journals[uuid.UUID(EXPERIMENT_ID).hex][1]
+            return state, recovered, replayed
+        state, recovered, replayed = asyncio.run(_run())
+        # snapshot after the 4th record, fill + sync replayed from the tail
+        assert replayed == 2
+        assert recovered.avaiable == state[0]
+        assert recovered.portfolio.portfolio_daily_value.tolist() == state[1]
+        assert recovered.position_tracker.get_positions() == state[2]
+
+    def test_envelope_not_journaled(self, patch_journal, tmp_path):
+        token = "70d4c731-484a-402e-9d64-2b83ba6558cc"
+
+        async def _run():
+            registry = patch_journal()
+            ledger = await registry.acquire(EXPERIMENT_ID)
+            await ledger._on_fill(Transaction(sid="600000", size=100, price=10.0, cost=0,
+                                              created_dt=datetime.datetime(2024, 1, 2, 10, 0)))
+            await ledger.on_event(EquityEvent(event_type="dividend", meta={}, token=token, experiment_id=EXPERIMENT_ID))
+            closes = base64.b64encode(np.asarray([11.0], dtype="<f8").tobytes())
+            await ledger.on_end_of_day(SyncArrayEvent(session_ix=20240102, sids=["600000"], closes=closes,
+                                                      token=token, experiment_id=EXPERIMENT_ID))
+            restarted = patch_journal()
+            recovered = await restarted.acquire(EXPERIMENT_ID)
+            return ledger, recovered
+        ledger, recovered = asyncio.run(_run())
+        journaled = b"".join(path.read_bytes() for path in tmp_path.rglob("*.log"))
+        assert journaled and token.encode() not in journaled
+        # replayed from the fields alone
+        assert recovered.position_tracker.get_positions() == ledger.position_tracker.get_positions()
+        assert recovered.portfolio.portfolio_daily_value.tolist() == ledger.portfolio.portfolio_daily_value.tolist()
+
+    def test_journal_config(self, tmp_path):
+        # off unless a directory is configured
+        assert on_journal_config({}) is None
+        assert on_journal_config({"BT_LEDGER_JOURNAL": str(tmp_path)}).path == str(tmp_path)
+
+    def test_malformed_id(self, patch_journal, tmp_path):
+        journal = patch_journal().journal
+        for experiment_id in ("../../tmp/x", "exp-1", ""):
+            with pytest.raises(ValueError):
+                journal.append(experiment_id, "fill", None)
+            with pytest.raises(ValueError):
+                experiment_id in journal
+        # rejected before any directory is created
+        assert not list(tmp_path.iterdir())
+
+
+class TestLedgerTrade:
+
+    @pytest.fixture
+    def patch_events(self):
+        minutes = {"open": [10.0] * 240, "high": [10.2] * 240, "low": [9.9] * 240,
+                   "close": [10.1] * 240, "volume": [1000.0] * 240}
+
+        def on_event(sid, order_type, price, created_dt):
+            asset = {"sid": sid, "first_trading": 20100101, "delist": 0}
+            order = {"asset": asset, "order_type": order_type, "direction": 1, "size": 1000,
+                     "price": price, "created_dt": created_dt}
+            return TradeEvent(orderMeta=order, payload=minutes, token="t", experiment_id=EXPERIMENT_ID)
+        return [on_event("600001", 4, 0, 202401021000), on_event("600002", 1, 9, 202401021000),
+                on_event("600001", 1, 10, 202401021030)]
+
+    def test_trade_batch(self, patch_events):
+        ledger = LedgerRegistry().get(EXPERIMENT_ID)
+        balance = ledger.avaiable
+        orders, txns = asyncio.run(ledger.on_trade_batch(patch_events))
+        # aligned with the submitted orders
+        assert [order.asset.sid for order in orders] == ["600001", "600002", "600001"]
+        assert txns[1] == '' and txns[0].sid == txns[2].sid == "600001"
+        # fills reach the tracker and the balance
+        assert ledger.position_tracker.sids == ["600001"]
+        assert ledger.position_tracker.upopened[0] == pytest.approx(txns[0].size + txns[2].size)
+        assert ledger.avaiable != balance
+
+    def test_cash_dividend(self):
+        ledger = LedgerRegistry().get(EXPERIMENT_ID)
+        txn = Transaction(sid="600001", size=100, price=10.0, cost=0, created_dt=datetime.datetime(2024, 1, 2, 10, 0))
+        asyncio.run(ledger._on_fill(txn))
+        asyncio.run(ledger.on_end_of_day(SyncEvent(session_ix=20240102, meta={"600001": 10.0},
+                                                   token="t", experiment_id=EXPERIMENT_ID)))
+        balance = ledger.avaiable
+        event = EquityEvent(event_type="split", meta={"600001": {"sid_bonus": 0, "sid_transfer": 0, "bonus": 2}},
+                            token="t", experiment_id=EXPERIMENT_ID)
+        asyncio.run(ledger.on_event(event))
+        # 2 per 10 shares in cash, position untouched
+        assert ledger.avaiable == pytest.approx(balance + 20)
+        assert ledger.position_tracker.size[0] == 100
+        assert ledger.portfolio.exposure.holding["600001"] == 100
+
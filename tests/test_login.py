@@ -1,9 +1,14 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import uuid
+import asyncio
 import pytest
 import httpx
 from urllib.parse import urljoin
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from web import login
 
 
 class TestLoginRouter:
@@ -47,6 +52,31 @@ class TestLoginRouter:
         print(response.json())
         assert response.status_code == 200
         assert response.json()["status"] == "success"
-    
-    
-    
\ No newline at end of file
+
+
+class TestLogout:
+
+    def test_invalidate_after_commit(self, patch_app, monkeypatch):
+        client, _, token, _, _ = patch_app
+        # cached under another spelling of the same token
+        asyncio.run(login.get_current_user(token.upper()))
+        assert uuid.UUID(token).hex in login.user_cache
+
+        calls = []
+        commit, invalidate = AsyncSession.commit, login.user_cache.invalidate
+
+        async def _commit(session):
+            calls.append("commit")
+            await commit(session)
+        monkeypatch.setattr(AsyncSession, "commit", _commit)
+        monkeypatch.setattr(login.user_cache, "invalidate", lambda key: (calls.append("invalidate"), invalidate(key)))
+        assert client.post("/user/on_logout", params={"token": token}).status_code == 200
+        # delete committed before the cached user is dropped
+        assert calls == ["commit", "invalidate"]
+        assert uuid.UUID(token).hex not in login.user_cache
+        for spelling in (token, token.upper(), uuid.UUID(token).hex):
+            with pytest.raises(HTTPException):
+                asyncio.run(login.get_current_user(spelling))
+        # token cache counters are not served
+        assert client.get("/user/on_cache").status_code == 404
+
@@ -0,0 +1,381 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import pickle
+import uuid
+import asyncio
+import pytest
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import MetaData, Table, Column, Integer, Float, String, Index, select, event, create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from core.ops.operator import async_ops
+from core.ops.journal import Journal
+from core.ops.writebehind import WriteBehind
+from core.ops.statements import statements
+from core.ops.schema import Base, Experiment, Order, schema_version
+from core.ops.partition import ensure_indexes, migrate_ddl, on_yearly
+from core.ops.migration import columns_ddl, reencode_positions
+from core.trade.codec import decode_positions
+
+
+@pytest.fixture
+def patch_ops():
+    metadata = MetaData()
+    table = Table("bulk_txn", metadata,
+                  Column("id", Integer, primary_key=True),
+                  Column("sid", String),
+                  Column("price", Float),
+                  Column("token", String, default=lambda: uuid.uuid4().hex))
+    Table("bulk_link", metadata,
+          Column("txn_id", Integer, primary_key=True),
+          Column("tag", String, nullable=False))
+    engine = create_async_engine("sqlite+aiosqlite://")
+
+    async def _create():
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+    asyncio.run(_create())
+    ops = async_ops
+    names = ("_initialized", "engine", "_tables", "session_factory")
+    saved = {name: ops.__dict__[name] for name in names if name in ops.__dict__}
+    ops._initialized, ops.engine, ops._tables = True, engine, metadata.tables
+    ops.session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    yield ops, table
+    for name in names:
+        ops.__dict__.pop(name, None)
+    ops.__dict__.update(saved)
+    asyncio.run(engine.dispose())
+
+
+class TestBulkInsert:
+
+    def test_rows(self):
+        frame = pd.DataFrame({"price": [1.0, 2.0], "sid": ["a", "b"], "extra": [0, 0]})
+        columns, rows = async_ops.on_rows(("id", "sid", "price"), frame)
+        # projected on the table order, unknown keys dropped
+        assert columns == ("sid", "price")
+        assert list(rows) == [("a", 1.0), ("b", 2.0)]
+        columns, rows = async_ops.on_rows(("id", "sid", "price"), {"sid": "a", "extra": 1})
+        assert columns == ("sid",) and list(rows) == [("a",)]
+        # keys of later rows kept, missing keys take the column default
+        columns, rows = async_ops.on_rows(("id", "sid", "price"), iter([{"sid": "a"}, {"sid": "b", "price": 2.0}]),
+                                          {"price": lambda: 0.0})
+        assert columns == ("sid", "price") and list(rows) == [("a", 0.0), ("b", 2.0)]
+
+    def test_bulk_insert_mixed_keys(self, patch_ops):
+        ops, table = patch_ops
+
+        async def _run():
+            await ops.on_bulk_insert("bulk_txn", [{"sid": "a"}, {"sid": "b", "price": 2.0, "token": "given"}])
+            async with ops.engine.connect() as conn:
+                return (await conn.execute(select(table).order_by(table.c.id))).all()
+        first, second = asyncio.run(_run())
+        assert second.price == 2.0 and second.token == "given"
+        # python default of the column, not NULL
+        assert first.price is None and len(first.token) == 32
+
+    def test_bulk_insert(self, patch_ops):
+        ops, table = patch_ops
+        frame = pd.DataFrame({"sid": [f"{ix:06d}" for ix in range(2500)], "price": range(2500), "extra": 0})
+
+        async def _run():
+            size = await ops.on_bulk_insert("bulk_txn", frame, chunksize=1000)
+            async with ops.engine.connect() as conn:
+                rows = (await conn.execute(select(table).order_by(table.c.id))).all()
+            return size, rows
+        size, rows = asyncio.run(_run())
+        assert size == len(rows) == 2500
+        assert rows[-1].sid == "002499" and rows[-1].price == 2499
+        # python side default filled for every row
+        assert len({row.token for row in rows}) == 2500
+
+    def test_query_batch(self, patch_ops):
+        ops, table = patch_ops
+        frame = pd.DataFrame({"sid": [f"{ix:06d}" for ix in range(2500)], "price": range(2500)})
+
+        async def _run():
+            await ops.on_bulk_insert("bulk_txn", frame)
+            return [batch async for batch in ops.on_query_batch(select(table.c.sid, table.c.price), batch_size=1000)]
+        batches = asyncio.run(_run())
+        assert [len(batch["sid"]) for batch in batches] == [1000, 1000, 500]
+        prices = np.concatenate([batch["price"] for batch in batches])
+        assert prices.dtype == np.float64 and prices[-1] == 2499
+
+
+class TestJournal:
+
+    def test_torn_tail(self, tmp_path):
+        journal = Journal(str(tmp_path))
+        for ix in range(3):
+            journal.append(f"event-{ix}".encode())
+        journal.close()
+        # crash in the middle of a frame
+        with open(tmp_path / "000000000000.log", "ab") as f:
+            f.write(b"\x10\x00\x00\x00partial")
+        journal = Journal(str(tmp_path))
+        journal.append(b"event-3")
+        assert list(journal.replay()) == [b"event-0", b"event-1", b"event-2", b"event-3"]
+
+    def test_rotate_drop(self, tmp_path):
+        journal = Journal(str(tmp_path), fsync_interval=None)
+        journal.append(b"a")
+        sealed = journal.rotate()
+        journal.append(b"b")
+        assert list(journal.replay(upto=sealed)) == [b"a"]
+        journal.drop(sealed)
+        assert list(journal.replay()) == [b"b"]
+
+
+class TestWriteBehind:
+
+    def test_replay(self, patch_ops, tmp_path):
+        ops, table = patch_ops
+
+        async def _crash():
+            writer = WriteBehind(path=str(tmp_path), flush_interval=60)
+            await writer.start()
+            for ix in range(10):
+                writer.put("bulk_txn", {"sid": f"{ix:06d}", "price": ix})
+            # process dies before the flush task runs
+            writer.journal.close()
+            writer._task.cancel()
+
+        async def _restart():
+            writer = WriteBehind(path=str(tmp_path), flush_interval=0.01)
+            await writer.start()
+            writer.put("bulk_txn", {"sid": "000010", "price": 10})
+            await asyncio.sleep(0.1)
+            await writer.stop()
+            async with ops.engine.connect() as conn:
+                rows = (await conn.execute(select(table.c.price).order_by(table.c.price))).scalars().all()
+            return writer.flushed, rows, writer.journal.segments()
+
+        asyncio.run(_crash())
+        flushed, rows, segments = asyncio.run(_restart())
+        assert flushed == 11
+        assert rows == list(range(11))
+        # flushed segments dropped, only the active one left
+        assert len(segments) == 1
+
+
+    def test_partial_failure(self, patch_ops, tmp_path, monkeypatch):
+        ops, table = patch_ops
+
+        async def _count(name):
+            async with ops.engine.connect() as conn:
+                return len((await conn.execute(select(ops._tables[name]))).all())
+
+        async def _run():
+            writer = WriteBehind(path=str(tmp_path), flush_interval=60)
+            await writer.start()
+            for ix in range(5):
+                writer.put("bulk_txn", {"id": ix, "sid": f"{ix:06d}", "price": ix})
+            # child row violating NOT NULL fails after bulk_txn was written
+            writer.put("bulk_link", {"txn_id": 0, "tag": None})
+            with pytest.raises(Exception):
+                await writer.flush()
+            # rolled back as a whole, batch kept for the retry
+            assert await _count("bulk_txn") == 0 and len(writer) == 6
+            writer._buffer["bulk_link"][0]["tag"] = "fixed"
+            assert await writer.flush() == 6
+            # crash between commit and drop ---> the same segments replayed on restart
+            writer.put("bulk_txn", {"id": 5, "sid": "000005", "price": 5})
+            monkeypatch.setattr(writer.journal, "drop", lambda upto: None)
+            await writer.flush()
+            await writer.stop()
+            restarted = WriteBehind(path=str(tmp_path), flush_interval=60)
+            await restarted.start()
+            await restarted.stop()
+            return await _count("bulk_txn"), await _count("bulk_link")
+        # replayed rows already written are skipped instead of failing forever
+        assert asyncio.run(_run()) == (6, 1)
+
+    def test_moved_aside(self, patch_ops, tmp_path):
+        ops, table = patch_ops
+
+        async def _run():
+            writer = WriteBehind(path=str(tmp_path), flush_interval=60, max_retries=2)
+            await writer.start()
+            writer.put("bulk_txn", {"id": 0, "sid": "000000", "price": 0})
+            writer.put("bulk_link", {"txn_id": 0, "tag": None})
+            for _ in range(2):
+                with pytest.raises(Exception):
+                    await writer.flush()
+            # bad batch out of the queue, later rows flush again
+            assert len(writer) == 0 and writer.failed == 2
+            writer.put("bulk_txn", {"id": 1, "sid": "000001", "price": 1})
+            assert await writer.flush() == 1
+            await writer.stop()
+            return [pickle.loads(payload) for payload in Journal(str(tmp_path / "failed")).replay()]
+        failed = asyncio.run(_run())
+        assert [table_name for table_name, _ in failed] == ["bulk_txn", "bulk_link"]
+
+
+class TestCoalesce:
+
+    def test_shared(self, patch_ops):
+        ops, table = patch_ops
+        statements = []
+        event.listen(ops.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        async def _run():
+            await ops.on_bulk_insert("bulk_txn", [{"sid": "600001", "price": 1.0}, {"sid": "600002", "price": 2.0}])
+            statements.clear()
+            query = select(table.c.price).where(table.c.sid == "600001")
+            other = select(table.c.price).where(table.c.sid == "600002")
+            return await asyncio.gather(*[ops.on_query_shared(query) for _ in range(20)],
+                                        ops.on_query_shared(other))
+        results = asyncio.run(_run())
+        assert results == [[1.0]] * 20 + [[2.0]]
+        # one query per distinct statement + parameters
+        assert len([statement for statement in statements if statement.startswith("SELECT")]) == 2
+
+    def test_statement_key(self):
+        statement = statements["user_experiments"]
+        assert async_ops.on_statement_key(statement, {"user_id": 1}) == \
+            async_ops.on_statement_key(statements["user_experiments"], {"user_id": 1})
+        assert async_ops.on_statement_key(statement, {"user_id": 1}) != \
+            async_ops.on_statement_key(statement, {"user_id": 2})
+        # literal values of a built select are part of the key
+        built = [select(Experiment).where(Experiment.user_id == user_id) for user_id in (1, 2)]
+        assert async_ops.on_statement_key(built[0]) != async_ops.on_statement_key(built[1])
+
+
+class TestPartition:
+
+    def test_migrate_ddl(self):
+        ddl = migrate_ddl(Base.metadata.tables["account"], on_yearly(2023, 2025))
+        assert ddl[0] == 'ALTER TABLE "account" RENAME TO "account_legacy"'
+        assert 'PARTITION BY RANGE ("date")' in ddl[3]
+        # primary key extended by the partition key
+        assert ddl[4].endswith('PRIMARY KEY ("id", "date")')
+        assert 'FOR VALUES FROM (20230000) TO (20240000)' in ddl[5]
+        assert any(statement.startswith("CREATE INDEX ix_account_experiment_date") for statement in ddl)
+        assert ddl[-1] == 'DROP TABLE "account_legacy"'
+
+    def test_ensure_indexes(self):
+        metadata = MetaData()
+        table = Table("history", metadata, Column("id", Integer, primary_key=True),
+                      Column("experiment_id", Integer), Column("date", Integer))
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            metadata.create_all(conn)
+            # index declared after the table exists
+            Index("ix_history_experiment_date", table.c.experiment_id, table.c.date)
+            assert ensure_indexes(conn, metadata) == ["ix_history_experiment_date"]
+            assert ensure_indexes(conn, metadata) == []
+
+
+class TestMigration:
+
+    def test_columns_ddl(self):
+        current = {("_order", "created_dt"): "integer", ("transaction", "created_dt"): "bigint"}
+        assert columns_ddl(current) == ['ALTER TABLE "_order" ALTER COLUMN "created_dt" TYPE bigint']
+        # fresh database ---> created by create_all with the declared type
+        assert columns_ddl({}) == []
+
+    def test_reencode_positions(self):
+        positions = {"600000": {"size": 100, "avaiable": 100, "cost_basis": 10.5, "price": 11.0, "sid": "600000"},
+                     "000001": {"size": 200, "avaiable": 0, "cost_basis": 9.0, "price": 8.5, "sid": "000001"}}
+        decoded = decode_positions(bytes.fromhex(reencode_positions(json.dumps(positions))))
+        assert list(decoded["sid"]) == ["600000", "000001"]
+        assert decoded["cost_basis"].tolist() == [10.5, 9.0] and decoded["avaiable"].tolist() == [100, 0]
+
+
+class TestBootstrap:
+
+    def test_schema_cache(self, tmp_path):
+        metadata = MetaData()
+        Table("minute", metadata, Column("sid", String(10)), Column("close", Float))
+        engine = create_engine("sqlite://")
+        reflected = MetaData()
+        with engine.begin() as conn:
+            metadata.create_all(conn)
+            reflected.reflect(conn)
+        path = str(tmp_path / "cache" / "schema.pkl")
+        async_ops.on_schema_dump(path, schema_version("v"), reflected)
+        loaded = async_ops.on_schema_load(path, schema_version("v"))
+        assert list(loaded.tables["minute"].columns.keys()) == ["sid", "close"]
+        # declared schema or options changed ---> reflect again
+        assert async_ops.on_schema_load(path, schema_version("other")) is None
+
+    def test_schema_stored(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+
+        async def _run():
+            async with engine.begin() as conn:
+                # database recreated ---> no schema_version table, the cache is not trusted
+                before = await async_ops.on_schema_stored(conn)
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.tables["schema_version"].create)
+                await async_ops.on_schema_store(conn, schema_version("v"))
+                await async_ops.on_schema_store(conn, schema_version("w"))
+            async with engine.connect() as conn:
+                after = await async_ops.on_schema_stored(conn)
+            await engine.dispose()
+            return before, after
+        before, after = asyncio.run(_run())
+        assert before is None and after == schema_version("w")
+
+    def test_warmup_failure(self, monkeypatch, caplog):
+        import web
+
+        async def _build_engine():
+            raise ConnectionError("database unreachable")
+
+        monkeypatch.setattr(async_ops, "_build_engine", _build_engine)
+        monkeypatch.setattr(async_ops, "_initialized", False)
+        monkeypatch.setattr(async_ops, "_bootstrap", None)
+        with caplog.at_level("ERROR", logger="web"):
+            asyncio.run(web._on_warmup())
+        assert "warmup failed" in caplog.text
+        # nothing is served on an unchecked schema, the next request bootstraps again
+        assert not async_ops._initialized
+
+    def test_single_bootstrap(self, monkeypatch):
+        calls = []
+
+        async def _build_engine():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+
+        ops = async_ops
+        monkeypatch.setattr(ops, "_build_engine", _build_engine)
+        monkeypatch.setattr(ops, "_initialized", False)
+        monkeypatch.setattr(ops, "_bootstrap", None)
+
+        async def _run():
+            # lifespan warmup and early requests share one bootstrap
+            await asyncio.gather(*[ops._ensure_initialized() for _ in range(5)])
+        asyncio.run(_run())
+        assert calls == [1] and ops._initialized
+
+
+class TestUnitOfWork:
+
+    def test_commit_failure(self, patch_ops):
+        ops, table = patch_ops
+        app = FastAPI()
+
+        @app.post("/insert")
+        async def insert_route(id: int, session: AsyncSession = Depends(ops.get_uow, scope="function")):
+            await session.execute(table.insert().values(id=id, sid="600001", price=1.0))
+            # deferred to the commit of get_uow
+            session.add(Order(id=1, sid="600001", created_dt=0, order_type=0, price=0, volume=0, experiment_id=1))
+            return {"status": "success"}
+
+        client = TestClient(app, raise_server_exceptions=False)
+        # _order table does not exist ---> commit fails after the route returned
+        resp = client.post("/insert", params={"id": 1})
+        assert resp.status_code == 500
+
+        async def _count():
+            async with ops.engine.connect() as conn:
+                return len((await conn.execute(select(table))).all())
+        # rolled back with the failed commit
+        assert asyncio.run(_count()) == 0
@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pickle
+import numpy as np
+import pytest
+from core.trade.portfolio import Portfolio, GrowableArray, Exposure
+from core.trade.position import PositionTracker
+
+
+class TestPortfolioHistory:
+
+    @pytest.fixture
+    def patch_portfolio(self):
+        portfolio = Portfolio(1e5)
+        for ix in range(300):
+            positions = {"600001": {"sid": "600001", "size": 100, "price": 10.0 + ix, "cost_basis": 10.0}}
+            if ix % 2:
+                positions["600002"] = {"sid": "600002", "size": 200, "price": 5.0, "cost_basis": 4.0}
+            portfolio.calc_portfolio(20240000 + ix, positions, cash=1e4)
+        return portfolio
+
+    def test_grow(self):
+        arr = GrowableArray(np.float64, capacity=1)
+        for ix in range(1000):
+            arr.append(ix)
+        assert len(arr) == 1000
+        assert arr.view()[-1] == 999
+
+    def test_frame(self, patch_portfolio):
+        frame = patch_portfolio.history.to_frame()
+        assert len(frame) == 300
+        assert frame.loc[20240001, "portfolio_value"] == pytest.approx(100 * 11.0 + 200 * 5.0)
+        assert np.shares_memory(frame.to_numpy(), patch_portfolio.history.values.view())
+        assert patch_portfolio.portfolio_daily_value.iloc[0] == pytest.approx(1000.0)
+
+    def test_pnl(self, patch_portfolio):
+        pnl = patch_portfolio.pnl
+        assert len(pnl) == 300 + 150
+        row = pnl[(pnl.session_ix == 20240001) & (pnl.sid == "600002")]
+        assert row.pnl.iloc[0] == pytest.approx(0.25)
+
+    def test_pickle(self, patch_portfolio):
+        restored = pickle.loads(pickle.dumps(patch_portfolio))
+        assert len(restored.history) == 300
+
+
+class TestExposure:
+
+    @pytest.fixture
+    def patch_exposure(self):
+        exposure = Exposure()
+        exposure.on_fill("600001", 100, 10.0)
+        exposure.on_fill("600002", 200, 5.0)
+        exposure.on_fill("600001", 100, 12.0)
+        return exposure
+
+    def test_fill(self, patch_exposure):
+        assert patch_exposure.market_value == pytest.approx(200 * 12.0 + 200 * 5.0)
+        assert patch_exposure.cost_basis["600001"] == pytest.approx(11.0)
+        assert sum(patch_exposure.weights().values()) == pytest.approx(1.0)
+
+    def test_close(self, patch_exposure):
+        patch_exposure.on_fill("600002", -200, 6.0)
+        assert "600002" not in patch_exposure.holding
+        assert patch_exposure.market_value == pytest.approx(200 * 12.0)
+
+    def test_pnl_changed_only(self, patch_exposure):
+        patch_exposure.on_pnl()
+        patch_exposure.on_mark("600002", 6.0)
+        pnl, changed = patch_exposure.on_pnl()
+        assert changed == {"600002"}
+        assert pnl["600002"] == pytest.approx(0.2)
+        assert patch_exposure.market_value == pytest.approx(patch_exposure.rebase())
+
+    def test_cash_dividend(self, patch_exposure):
+        patch_exposure.on_pnl()
+        size_ratio, _ = PositionTracker._calc_ratio({"sid_bonus": 0, "sid_transfer": 0, "bonus": 2})
+        patch_exposure.on_split("600001", size_ratio)
+        assert patch_exposure.holding["600001"] == 200
+        assert patch_exposure.cost_basis["600001"] == pytest.approx(11.0)
+        assert not patch_exposure.on_pnl()[1]
+
+    def test_session(self):
+        portfolio = Portfolio(1e5)
+        portfolio.exposure.on_fill("600001", 100, 10.0)
+        value, pnl, usage = portfolio.on_session(20240102, cash=1e4)
+        assert value == pytest.approx(1000.0)
+        assert usage == pytest.approx(0.01)
+        portfolio.on_session(20240103, cash=1e4)
+        assert len(portfolio.pnl) == 1
@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import base64
+import datetime
+import json
+import numpy as np
+import pytest
+from core.event import SyncArrayEvent
+from core.trade.order import Transaction
+from core.trade.position import ArrayPositionTracker
+from core.trade.codec import encode_arrays, encode_positions, decode_positions
+
+
+def on_txn(sid, size, price):
+    return Transaction(sid=sid, size=size, price=price, cost=0,
+                       created_dt=datetime.datetime(2024, 1, 2, 10, 0))
+
+
+class TestArrayPositionTracker:
+
+    @pytest.fixture
+    def patch_tracker(self):
+        tracker = ArrayPositionTracker(capacity=2)
+        txns = [on_txn("600001", 100, 10.0), on_txn("600002", 200, 5.0), on_txn("600003", 300, 2.0)]
+        asyncio.run(tracker.update(txns))
+        return tracker
+
+    def test_update(self, patch_tracker):
+        assert len(patch_tracker) == 3
+        assert list(patch_tracker.upopened) == [100, 200, 300]
+        # T+1 ---> nothing available before sync
+        assert not patch_tracker.avaiable.any()
+        asyncio.run(patch_tracker.update([on_txn("600001", 100, 12.0)]))
+        assert patch_tracker.cost_basis[0] == pytest.approx(11.0)
+
+    def test_syncronize(self, patch_tracker):
+        asyncio.run(patch_tracker.syncronize({"600001": 11.0, "600002": 6.0}, 20240102))
+        assert list(patch_tracker.size) == [100, 200, 300]
+        assert list(patch_tracker.avaiable) == [100, 200, 300]
+        assert list(patch_tracker.price) == [11.0, 6.0, 0.0]
+        assert not patch_tracker.upopened.any()
+
+    def test_close_position(self, patch_tracker):
+        asyncio.run(patch_tracker.syncronize({"600001": 11.0, "600002": 6.0, "600003": 2.0}, 20240102))
+        asyncio.run(patch_tracker.update([on_txn("600001", -100, 11.0)]))
+        assert "600001" not in patch_tracker
+        assert patch_tracker.sids == ["600003", "600002"]
+        assert patch_tracker.get_positions()["600003"]["size"] == 300
+        assert len(patch_tracker.record_closed_position["2024-01-02"]) == 1
+
+    def test_split_weights(self, patch_tracker):
+        asyncio.run(patch_tracker.syncronize({"600001": 10.0, "600002": 5.0, "600003": 2.0}, 20240102))
+        bonus = asyncio.run(patch_tracker._on_split({"600002": {"sid_bonus": 10, "sid_transfer": 10, "bonus": 1}}))
+        assert bonus == pytest.approx(20.0)
+        # 10 bonus + 10 transfer shares per 10 held
+        assert patch_tracker.size[1] == 600
+        weights = patch_tracker.weights()
+        assert sum(weights.values()) == pytest.approx(1.0)
+
+    def test_cash_dividend(self, patch_tracker):
+        asyncio.run(patch_tracker.syncronize({"600001": 10.0, "600002": 5.0, "600003": 2.0}, 20240102))
+        bonus = asyncio.run(patch_tracker._on_split({"600002": {"sid_bonus": 0, "sid_transfer": 0, "bonus": 2}}))
+        # cash only ---> size and cost basis unchanged
+        assert bonus == pytest.approx(40.0)
+        assert patch_tracker.size[1] == 200 and patch_tracker.cost_basis[1] == pytest.approx(5.0)
+
+    def test_syncronize_arrays(self, patch_tracker):
+        closes = np.array([6.0, 11.0, 99.0])
+        asyncio.run(patch_tracker.syncronize_arrays(["600002", "600001", "000001"], closes, 20240102))
+        assert list(patch_tracker.price) == [11.0, 6.0, 0.0]
+        assert list(patch_tracker.avaiable) == [100, 200, 300]
+        asyncio.run(patch_tracker.syncronize_arrays(list(patch_tracker.sids), np.array([1.0, 2.0, 3.0]), 20240103))
+        assert list(patch_tracker.price) == [1.0, 2.0, 3.0]
+
+
+class TestSyncArrayEvent:
+
+    def test_decode(self):
+        closes = base64.b64encode(np.array([10.5, 3.25], dtype="<f8").tobytes()).decode()
+        event = SyncArrayEvent(session_ix=20240102, sids=["600001", "600002"], closes=closes,
+                               token="token", experiment_id="exp-1")
+        assert list(event.on_closes()) == [10.5, 3.25]
+
+    def test_misaligned(self):
+        closes = base64.b64encode(np.array([10.5], dtype="<f8").tobytes()).decode()
+        with pytest.raises(ValueError):
+            SyncArrayEvent(session_ix=20240102, sids=["600001", "600002"], closes=closes,
+                           token="token", experiment_id="exp-1")
+
+
+class TestPositionsCodec:
+
+    def test_roundtrip(self):
+        tracker = ArrayPositionTracker()
+        asyncio.run(tracker.update([on_txn(f"{600000 + ix}", 100 * (ix + 1), 10.0 + ix) for ix in range(50)]))
+        asyncio.run(tracker.syncronize({f"{600000 + ix}": 11.0 + ix for ix in range(50)}, 20240102))
+        blob = encode_arrays(*tracker.get_arrays())
+        decoded = decode_positions(blob)
+        assert list(decoded["sid"]) == tracker.sids
+        assert np.array_equal(decoded["cost_basis"], tracker.cost_basis)
+        assert np.array_equal(decoded["price"], tracker.price)
+        # same snapshot as the json text column
+        assert encode_positions(tracker.get_positions()) == blob
+        assert len(blob) < len(json.dumps(tracker.get_positions())) / 2
+
+    def test_invalid(self):
+        # S10 would truncate silently
+        with pytest.raises(ValueError):
+            encode_positions({"60000012345": {"size": 1, "avaiable": 1, "cost_basis": 1.0, "price": 1.0}})
+        with pytest.raises(ValueError):
+            encode_arrays(["600000", "600001"], [1.0], [1.0, 1.0], [1.0, 1.0], [1.0, 1.0])
+        blob = encode_arrays(["600000"], [1.0], [1.0], [1.0], [1.0])
+        with pytest.raises(ValueError):
+            decode_positions(b"\x02" + blob[1:])
+
+    def test_empty(self):
+        decoded = decode_positions(encode_positions({}))
+        assert len(decoded["sid"]) == 0 and decoded["size"].dtype == np.float64
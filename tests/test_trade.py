@@ -1,10 +1,19 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import uuid
+import base64
+import asyncio
+import numpy as np
 import pandas as pd
 import pytest
 import httpx
+from types import SimpleNamespace
 from urllib.parse import urljoin
+from sqlalchemy import BigInteger, select
+from core.ops.operator import async_ops
+from core.ops.schema import Experiment, Order, Transaction, Account
+from web import trade
 
 
 class TestTradeRouter:
@@ -58,6 +67,133 @@ class TestTradeRouter:
         response = httpx.get(url)
         print(response.json())
         assert response.status_code == 200
-    
-    
-    
\ No newline at end of file
+
+
+class TestTradeAuth:
+
+    @pytest.fixture
+    def patch_order(self):
+        asset = {"sid": "600001", "first_trading": 20100101, "delist": 0}
+        return {"asset": asset, "order_type": 4, "direction": 1, "size": 100, "price": 100, "created_dt": 202401020930}
+
+    def test_batch_unauthorized(self, patch_app, patch_order):
+        client, ledgers, token, experiment_id, foreign_id = patch_app
+        events = [{"orderMeta": patch_order, "payload": {}, "token": uuid.uuid4().hex, "experiment_id": experiment_id}]
+        assert client.post("/trade/on_execute_batch", json=events).status_code == 401
+        # foreign experiment with a valid token
+        events = [{"orderMeta": patch_order, "payload": {}, "token": token, "experiment_id": foreign_id}]
+        assert client.post("/trade/on_execute_batch", json=events).status_code == 404
+        # rejected before the ledger is created
+        assert experiment_id not in ledgers and foreign_id not in ledgers
+
+    def test_event_unauthorized(self, patch_app):
+        client, ledgers, token, experiment_id, foreign_id = patch_app
+        event = {"event_type": "dividend", "meta": {}, "token": token, "experiment_id": foreign_id}
+        assert client.post("/trade/on_event", json=event).status_code == 404
+        event = {"session_ix": 20240102, "meta": {"600001": 10.0}, "token": token, "experiment_id": foreign_id}
+        assert client.post("/trade/on_sync", json=event).status_code == 404
+        assert foreign_id not in ledgers
+
+    def test_execute_unauthorized(self, patch_app, patch_order):
+        client, ledgers, token, experiment_id, foreign_id = patch_app
+        event = {"orderMeta": patch_order, "payload": {}, "token": token, "experiment_id": foreign_id}
+        assert client.post("/trade/on_execute", json=event).status_code == 404
+        event = {"orderMeta": patch_order, "payload": {}, "token": uuid.uuid4().hex, "experiment_id": experiment_id}
+        assert client.post("/trade/on_execute", json=event).status_code == 401
+        assert experiment_id not in ledgers and foreign_id not in ledgers
+
+
+class TestTradeBatch:
+
+    @pytest.fixture
+    def patch_events(self, patch_app):
+        _, _, token, experiment_id, _ = patch_app
+        asset = {"sid": "600001", "first_trading": 20100101, "delist": 0}
+        minutes = {"open": [10.0] * 240, "high": [10.2] * 240, "low": [9.9] * 240, 
+                   "close": [10.1] * 240, "volume": [1000.0] * 240}
+        orders = [{"asset": asset, "order_type": 4, "direction": 1, "size": 1000, "price": 0, "created_dt": 202401021000},
+                  {"asset": asset, "order_type": 1, "direction": 1, "size": 1000, "price": 9, "created_dt": 202401021000},
+                  {"asset": asset, "order_type": 1, "direction": 1, "size": 1000, "price": 10, "created_dt": 202401021030}]
+        return [{"orderMeta": order, "payload": minutes, "token": token, "experiment_id": experiment_id} for order in orders]
+
+    def test_execute_batch(self, patch_app, patch_events):
+        client, ledgers, _, experiment_id, _ = patch_app
+        resp = client.post("/trade/on_execute_batch", json=patch_events)
+        assert resp.status_code == 200
+        # limit 9 is never touched
+        assert resp.json() == {"filled": 2, "status": "success"}
+        ledger = ledgers.get(experiment_id)
+        assert list(ledger.portfolio.exposure.holding) == ["600001"]
+
+        async def _rows():
+            async with async_ops.engine.connect() as conn:
+                orders = (await conn.execute(select(Order.created_dt).order_by(Order.created_dt))).scalars().all()
+                txns = (await conn.execute(select(Transaction.created_dt))).scalars().all()
+            return orders, txns
+        orders, txns = asyncio.run(_rows())
+        # %Y%m%d%H%M does not fit int4
+        assert orders == [202401021000, 202401021000, 202401021030]
+        assert len(txns) == 2 and all(dt > 2 ** 31 for dt in txns)
+        assert isinstance(Order.__table__.c.created_dt.type, BigInteger)
+        assert isinstance(Transaction.__table__.c.created_dt.type, BigInteger)
+
+    def test_execute(self, patch_app, patch_events):
+        client, ledgers, _, experiment_id, _ = patch_app
+        resp = client.post("/trade/on_execute", json=patch_events[0])
+        assert resp.status_code == 200 and resp.json() == {"filled": 1, "status": "success"}
+
+        async def _rows():
+            async with async_ops.engine.connect() as conn:
+                orders = (await conn.execute(select(Order.order_id, Order.volume))).all()
+                txns = (await conn.execute(select(Transaction.order_id, Transaction.volume))).all()
+            return orders, txns
+        orders, txns = asyncio.run(_rows())
+        # order row linked to its fill, volume taken from the fill
+        assert len(orders) == 1 and len(txns) == 1
+        assert orders[0].order_id == txns[0].order_id and orders[0].volume == txns[0].volume
+
+    def test_execute_write_behind(self, patch_app, patch_events, monkeypatch):
+        client, _, _, _, _ = patch_app
+        rows = []
+        monkeypatch.setattr(trade, "write_behind", SimpleNamespace(running=True, put=lambda *row: rows.append(row)))
+        assert client.post("/trade/on_execute", json=patch_events[0]).status_code == 200
+        # acknowledged once journaled, same rows as on_execute_batch
+        assert [table_name for table_name, _ in rows] == ["_order", "transaction", "order_transaction"]
+        assert rows[1][1]["order_id"] == rows[0][1]["order_id"]
+
+    def test_market_call_order(self, patch_app, patch_events):
+        client, ledgers, _, experiment_id, _ = patch_app
+        sell = dict(patch_events[0]["orderMeta"], direction=0, size=0, amount=100000, price=0)
+        events = patch_events + [dict(patch_events[0], orderMeta=sell)]
+        resp = client.post("/trade/on_execute_batch", json=events)
+        assert resp.status_code == 200 and resp.json()["filled"] == 3
+
+        async def _rows():
+            async with async_ops.engine.connect() as conn:
+                return (await conn.execute(select(Order.volume, Transaction.volume)
+                                           .join(Transaction, Transaction.order_id == Order.order_id, isouter=True)
+                                           .order_by(Order.id))).all()
+        # price 0 never divides, every order persisted with the volume of its fill
+        rows = asyncio.run(_rows())
+        assert len(rows) == 4 and rows[-1][0] == rows[-1][1]
+
+    def test_sync_arrays(self, patch_app, patch_events):
+        client, _, token, experiment_id, _ = patch_app
+        assert client.post("/trade/on_execute_batch", json=patch_events).status_code == 200
+        closes = base64.b64encode(np.asarray([10.5], dtype="<f8").tobytes()).decode()
+        event = {"session_ix": 20240102, "sids": ["600001"], "closes": closes, "token": token, "experiment_id": experiment_id}
+        assert client.post("/trade/on_sync_arrays", json=event).status_code == 200
+
+        async def _rows():
+            async with async_ops.engine.connect() as conn:
+                accounts = (await conn.execute(select(Account.experiment_id, Account.date))).all()
+                experiments = (await conn.execute(select(Experiment.id, Experiment.experiment_id))).all()
+            return accounts, experiments
+        accounts, experiments = asyncio.run(_rows())
+        # account of the existing experiment, no orphan experiment row
+        owned = [row.id for row in experiments if str(row.experiment_id) == experiment_id]
+        assert accounts == [(owned[0], 20240102)] and len(experiments) == 2
+        # unknown token is rejected as well
+        event["token"] = uuid.uuid4().hex
+        assert client.post("/trade/on_sync_arrays", json=event).status_code == 401
+
@@ -4,13 +4,14 @@ Created on Tue Mar 12 15:37:47 2019
 
 @author: python
 """
-from collections import MutableMapping
+from collections import OrderedDict
+from collections.abc import MutableMapping
 from functools import partial
-from distutils import dir_util
 from shutil import rmtree, move
 from tempfile import mkdtemp, NamedTemporaryFile
-import os, pickle, errno, pandas as pd
-from util.paths import ensure_directory
+import os, time, pickle, errno, asyncio, pandas as pd
+from utils.paths import ensure_directory
+from utils.context_tricks import nop_context
 
 
 # cacheObject --- bar_reader
@@ -127,6 +128,152 @@ class ExpiredCache(object):
         del self._cache[key]
 
 
+class LRUCache(ExpiredCache):
+    """
+    A bounded ExpiredCache which evicts the least recently used CachedObject
+    once ``maxsize`` entries are held, and counts hits / misses.
+
+    Parameters
+    ----------
+    maxsize : int
+        Max number of cached objects.
+    """
+    def __init__(self, maxsize=128):
+        self._cache = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, dts):
+        try:
+            value = super().get(key, dts)
+        except (KeyError, Expired):
+            self.misses += 1
+            self._cache.pop(key, None)
+            raise KeyError(key)
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expiration_dt):
+        super().set(key, value, expiration_dt)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._cache), "maxsize": self.maxsize}
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SingleFlight(object):
+    """
+    Concurrent calls for the same key share one in flight task, the loader
+    runs once and every caller awaits its result (or its exception).
+
+    A cancelled caller does not cancel the shared task.
+    """
+    def __init__(self):
+        self._calls = {}
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        try:
+            task = self._calls[key]
+            self.shared += 1
+        except KeyError:
+            task = self._calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda done: self._calls.pop(key, None) if self._calls.get(key) is done else None)
+        return await asyncio.shield(task)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class AsyncTTLCache(object):
+    """
+    A bounded read-through cache for coroutine loaders. Entries expire
+    ``ttl`` seconds after they were loaded, the least recently used entry is
+    evicted beyond ``maxsize`` and concurrent misses of one key are
+    de-duplicated through SingleFlight. Loader exceptions are not cached.
+
+    Parameters
+    ----------
+    maxsize : int
+        Max number of cached values.
+    ttl : float
+        Seconds a loaded value stays valid.
+    """
+    def __init__(self, maxsize=1024, ttl=300.0, clock=time.monotonic):
+        self._cache = OrderedDict()
+        self._flight = SingleFlight()
+        # bumped by invalidate / clear, a load started before is not stored
+        self._version = 0
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, loader, *args, **kwargs):
+        """
+        Cached value of ``key`` or ``await loader(*args, **kwargs)`` on a miss.
+        """
+        try:
+            value, expires = self._cache[key]
+            if self.clock() < expires:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._cache[key]
+        except KeyError:
+            pass
+        self.misses += 1
+        version = self._version
+        value = await self._flight.do(key, loader, *args, **kwargs)
+        if version == self._version:
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self._cache[key] = (value, self.clock() + self.ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, key):
+        self._version += 1
+        self._cache.pop(key, None)
+
+    def clear(self):
+        self._version += 1
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self._flight.shared,
+                "size": len(self._cache), "maxsize": self.maxsize, "ttl": self.ttl}
+
+    def __contains__(self, key):
+        try:
+            return self.clock() < self._cache[key][1]
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return len(self._cache)
+
+
 class DummyMapping(object):
     """
     Dummy object used to provide a mapping interface for singular values.
@@ -30,18 +30,19 @@ def market_utc(date, tzinfo="Asia/Shanghai"):
     return m_open, m_close
 
 def elapsed(dt, fmt="%Y%m%d%H%M"):
-    # %-m 不补0
-    fmt = datetime.datetime.strptime(dt, fmt)
-    delta = fmt - datetime.datetime(year=fmt.year, month=fmt.month, day=fmt.day, hours=9, minutes=30)
-    return delta.seconds
+    # trading seconds since 9:30, lunch break 11:30 - 13:00 excluded
+    struct_dt = datetime.datetime.strptime(str(dt), fmt)
+    seconds = max((struct_dt - struct_dt.replace(hour=9, minute=30)).total_seconds(), 0)
+    return seconds - 90 * 60 if struct_dt.hour >= 13 else min(seconds, 2 * 60 * 60)
 
 def loc2dt(anchor, dt):
     """
         9:30 - 11:30 / 1:00 - 3:00
     """
+    # 3s tick index, 2 * 60 * 20 ticks in the morning
     ifAm = anchor - 2*60*20
-    struct_dt = datetime.datetime.strptime(str(dt), "%Y%m%d")
-    if ifAm:
+    struct_dt = datetime.datetime.strptime(str(dt)[:8], "%Y%m%d")
+    if ifAm < 0:
         offset_dt = struct_dt + datetime.timedelta(seconds=anchor * 3) + datetime.timedelta(hours=9, minutes=30)
     else:
         offset_dt = struct_dt + datetime.timedelta(seconds=ifAm * 3) + datetime.timedelta(hours=13)
@@ -3,15 +3,47 @@
 import signal
 import sys
 import atexit
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from .login import router as login_router
 from .trade import router as trade_router
 from .stats import router as stats_router
+from core.ops.writebehind import write_behind
+from core.ops.operator import async_ops
+
+logger = logging.getLogger(__name__)
+
+
+async def _on_warmup():
+    try:
+        await async_ops.warmup()
+    except Exception:
+        # serving goes on: a failed bootstrap leaves async_ops uninitialized, so every database
+        # request re-runs it (schema_version check + create_all / migrations) before its query
+        # ---> a stale schema is migrated or the request fails, it is never queried as is
+        logger.exception("warmup failed, schema bootstrap retried on the first request")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema bootstrap + pool warmup in the background, serving starts at once
+    warmup = asyncio.create_task(_on_warmup())
+    # write behind mode ---> replay the journal left by a crash before serving
+    if write_behind.enabled:
+        await write_behind.start()
+    yield
+    if write_behind.running:
+        await write_behind.stop()
+    if not warmup.done():
+        warmup.cancel()
+
 
 # 创建 FastAPI 应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,197 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    sticky experiment routing --- ledgers live in worker memory, so every request of one
+    experiment must land on the same worker process
+
+    front process (this module) ---> crc32(uuid bytes of experiment_id) % workers ---> uvicorn worker on unix socket
+    websockets (ledger feeds /stats/ws/feed/{experiment_id}) are proxied to the owning worker as well
+
+    python -m web.dispatch --workers 4 --port 11000
+"""
+import os
+import re
+import sys
+import json
+import asyncio
+import shutil
+import signal
+import zlib
+import uuid
+import argparse
+import itertools
+import tempfile
+import multiprocessing
+from typing import List, Optional
+from urllib.parse import parse_qs
+import httpx
+import uvicorn
+try:
+    # shipped with uvicorn[standard]
+    from websockets.asyncio.client import unix_connect
+    from websockets.exceptions import ConnectionClosed
+except ImportError:
+    unix_connect, ConnectionClosed = None, Exception
+
+# hop-by-hop headers are not forwarded
+HOP_HEADERS = {b"host", b"connection", b"keep-alive", b"transfer-encoding", b"content-length"}
+# ledger feed of one experiment
+FEED_PATH = re.compile(r"/ws/feed/([^/]+)$")
+
+
+class Dispatcher(object):
+    """
+        ASGI front app forwarding http requests and websockets to the worker owning their experiment_id
+        experiment_id is read from the query string, the feed path or the json body (list body ---> first item)
+        requests without experiment_id (login / display) are spread round robin
+    """
+    def __init__(self, sockets: List[str]):
+        self.sockets = sockets
+        self.clients = [httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path),
+                                          base_url="http://worker",
+                                          timeout=60)
+                        for path in sockets]
+        self._round_robin = itertools.count()
+
+    def route(self, experiment_id: Optional[str]) -> int:
+        if experiment_id is None:
+            return next(self._round_robin) % len(self.clients)
+        try:
+            # every spelling (case, hyphens) of one uuid ---> one owner
+            key = uuid.UUID(str(experiment_id)).bytes
+        except ValueError:
+            # rejected by the worker anyway (404), never spread across workers
+            return 0
+        return zlib.crc32(key) % len(self.clients)
+
+    @staticmethod
+    def on_experiment(scope, body: bytes) -> Optional[str]:
+        query = parse_qs(scope.get("query_string", b"").decode())
+        if "experiment_id" in query:
+            return query["experiment_id"][0]
+        feed = FEED_PATH.search(scope.get("path", ""))
+        if feed:
+            return feed.group(1)
+        if not body:
+            return None
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        if isinstance(payload, list):
+            payload = payload[0] if payload else {}
+        return payload.get("experiment_id") if isinstance(payload, dict) else None
+
+    async def _on_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for client in self.clients:
+                    await client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    def on_path(scope) -> str:
+        path = scope["raw_path"].decode() if scope.get("raw_path") else scope["path"]
+        if scope.get("query_string"):
+            path = f"{path}?{scope['query_string'].decode()}"
+        return path
+
+    async def _on_websocket(self, scope, receive, send):
+        """
+            relay frames both ways between the client and the owning worker,
+            a worker rejecting the handshake (unknown token / experiment) is answered with 1008
+        """
+        await receive()
+        if unix_connect is None:
+            await send({"type": "websocket.close", "code": 1011})
+            return
+        path = self.sockets[self.route(self.on_experiment(scope, b""))]
+        try:
+            upstream = await unix_connect(path, f"ws://worker{self.on_path(scope)}")
+        except Exception:
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        await send({"type": "websocket.accept"})
+
+        async def _on_upstream():
+            async for data in upstream:
+                await send({"type": "websocket.send", "text" if isinstance(data, str) else "bytes": data})
+            await send({"type": "websocket.close", "code": upstream.close_code or 1000})
+
+        relay = asyncio.create_task(_on_upstream())
+        try:
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                await upstream.send(message["text"] if message.get("text") is not None else message["bytes"])
+        except ConnectionClosed:
+            # worker side closed, the relay already closed the client
+            pass
+        finally:
+            relay.cancel()
+            await upstream.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._on_lifespan(receive, send)
+        if scope["type"] == "websocket":
+            return await self._on_websocket(scope, receive, send)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        client = self.clients[self.route(self.on_experiment(scope, body))]
+        path = self.on_path(scope)
+        headers = [(k, v) for k, v in scope["headers"] if k not in HOP_HEADERS]
+        resp = await client.request(scope["method"], path, headers=headers, content=body)
+
+        await send({"type": "http.response.start",
+                    "status": resp.status_code,
+                    "headers": [(k, v) for k, v in resp.headers.raw if k.lower() not in HOP_HEADERS]})
+        await send({"type": "http.response.body", "body": resp.content})
+
+
+def _on_worker(app: str, path: str):
+    uvicorn.run(app, uds=path, log_level="warning")
+
+
+def serve(workers: int = 4, host: str = "0.0.0.0", port: int = 11000, app: str = "web:app",
+          socket_dir: Optional[str] = None):
+    """
+        start one uvicorn worker per unix socket and the dispatcher in front of them
+    """
+    tmp_dir = None if socket_dir else tempfile.mkdtemp(prefix="bt_engine_")
+    sockets = [os.path.join(socket_dir or tmp_dir, f"worker_{ix}.sock") for ix in range(workers)]
+    procs = [multiprocessing.Process(target=_on_worker, args=(app, path), daemon=True) for path in sockets]
+    for proc in procs:
+        proc.start()
+    # uvicorn re-raises the captured SIGTERM after shutdown, exit through finally to stop workers
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        uvicorn.run(Dispatcher(sockets), host=host, port=port, log_level="warning")
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=11000)
+    parser.add_argument("--app", default="web:app")
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port, args.app)
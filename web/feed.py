@@ -0,0 +1,101 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    per experiment ledger deltas pushed to websocket subscribers
+
+    fill --- every transaction (unique key, oldest dropped once a client queue is full)
+    position --- latest state of a sid (key per sid, coalesced)
+    portfolio --- latest value / cash (one key, coalesced)
+"""
+import json
+import asyncio
+import itertools
+from collections import OrderedDict, defaultdict
+
+
+class LatestQueue(object):
+    """
+        per client queue coalescing by key, a slow consumer only sees the latest message of each key
+        bounded by maxsize distinct keys, the oldest key is dropped when full
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = OrderedDict()
+        self._event = asyncio.Event()
+
+    def put(self, key, message):
+        if key in self._items:
+            # drop to latest, keep the queue position of the key
+            self.dropped += 1
+        elif len(self._items) >= self.maxsize:
+            self._items.popitem(last=False)
+            self.dropped += 1
+        self._items[key] = message
+        self._event.set()
+
+    async def get(self):
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        return self._items.popitem(last=False)[1]
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FeedHub(object):
+    """
+        experiment_id ---> subscriber queues, messages serialized once per publish
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._subscribers = defaultdict(set)
+        self._seq = itertools.count()
+
+    def subscribe(self, experiment_id: str) -> LatestQueue:
+        queue = LatestQueue(self.maxsize)
+        self._subscribers[experiment_id].add(queue)
+        return queue
+
+    def unsubscribe(self, experiment_id: str, queue: LatestQueue):
+        self._subscribers[experiment_id].discard(queue)
+        if not self._subscribers[experiment_id]:
+            del self._subscribers[experiment_id]
+
+    def publish(self, experiment_id: str, key, message: dict):
+        queues = self._subscribers.get(experiment_id)
+        if not queues:
+            return
+        text = json.dumps(message, default=str)
+        for queue in queues:
+            queue.put(key, text)
+
+    def on_ledger(self, experiment_id: str, ledger, txns=(), sids=()):
+        """
+            publish fills, changed positions (filled sids + sids) and portfolio value of a ledger after a mutation
+        """
+        if experiment_id not in self._subscribers:
+            return
+        exposure = ledger.portfolio.exposure
+        sids = list(sids)
+        for txn in txns:
+            if not txn:
+                continue
+            self.publish(experiment_id, ("fill", next(self._seq)),
+                         {"type": "fill", "sid": txn.sid, "price": txn.price, "size": txn.size,
+                          "cost": txn.cost, "created_dt": txn.created_dt})
+            sids.append(txn.sid)
+        for sid in dict.fromkeys(sids):
+            self.publish(experiment_id, ("position", sid),
+                         {"type": "position", "sid": sid,
+                          "holding": exposure.holding.get(sid, 0),
+                          "price": exposure.price.get(sid),
+                          "cost_basis": exposure.cost_basis.get(sid)})
+        self.publish(experiment_id, ("portfolio",),
+                     {"type": "portfolio", "value": exposure.market_value, "cash": ledger.avaiable})
+
+
+feed = FeedHub()
+
+__all__ = ["feed", "FeedHub", "LatestQueue"]
@@ -1,73 +1,116 @@
 # !/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import uuid
 import asyncio
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 from functools import lru_cache
 
 from core.ops.schema import *
 from core.event import LoginEvent
 from core.ops.operator import async_ops
+from core.ops.statements import statements
+from utils.cache import AsyncTTLCache
 
 router = APIRouter()
 
 
-def async_lru_cache(func):
-    cache = {}
-    async def wrapper(*args, **kwargs):
-        if (*args, *kwargs) in cache:
-            return cache[(*args, *kwargs)]
-        else:
-            cache[(*args, *kwargs)] = await func(*args, **kwargs)
-            return cache[(*args, *kwargs)]
-    return wrapper
+# token hex ---> user, read through with ttl, concurrent misses of one token share one query
+# keyed by the canonical hex ---> every spelling of a token is dropped by one invalidation
+user_cache = AsyncTTLCache(maxsize=4096, ttl=300)
 
 
-@async_lru_cache
-async def get_current_user(token: str):
+def on_uuid(value: str, status_code: int, detail: str) -> uuid.UUID:
+    # uuid columns bind uuid.UUID on every dialect, malformed values never reach the db
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise HTTPException(status_code=status_code, detail=detail)
+
+
+async def _on_user(token: uuid.UUID):
     # token to user_id
-    req = select(Token).options(joinedload(Token.user)).where(Token.token == token)
-    token_obj = await async_ops.on_query_obj(req)
+    token_obj = await async_ops.on_query_obj(statements["token_user"], params={"token": token})
+    if not token_obj:
+        raise HTTPException(status_code=401, detail="invalid token")
     return token_obj[0].user
 
 
+async def get_current_user(token: str):
+    token = on_uuid(token, 401, "invalid token")
+    return await user_cache.get(token.hex, _on_user, token)
+
+
+async def get_experiment(token: str, experiment_id: str, session: AsyncSession = None):
+    """
+        token ---> user ---> experiment owned by the user, 401 / 404 before anything is mutated
+    """
+    user = await get_current_user(token)
+    experiment = await async_ops.on_query_obj(statements["user_experiment"], session=session, 
+                                              params={"user_id": user.id, 
+                                                      "experiment_id": on_uuid(experiment_id, 404, "experiment not found")})
+    if not experiment:
+        raise HTTPException(status_code=404, detail="experiment not found")
+    return user, experiment[0]
+
+
 @router.post("/on_login")
-async def on_login(item: LoginEvent):
+async def on_login(item: LoginEvent, session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
     """
         query user info from db and build token to db
     """
-    req = select(User).where(and_(User.name == item.name, User.phone == item.phone))
-    user = await async_ops.on_query_obj(req)
+    user = await async_ops.on_query_obj(statements["user_login"], session=session, 
+                                        params={"name": item.name, "phone": item.phone})
     if not user:
         assert item.auto_register, "user not found and auto_register is False"
         user_obj = User(name=item.name, phone=item.phone)
         print(user_obj)
-        await async_ops.on_insert_obj(user_obj)
+        await async_ops.on_insert_obj(user_obj, session=session)
         token_obj = Token(user_id=user_obj.id)
         token_obj.user = user_obj
-        resp = await async_ops.on_insert_obj(token_obj)
+        resp = await async_ops.on_insert_obj(token_obj, session=session)
     else:
-        req = select(Token).where(Token.user_id == user.id)
-        resp = await async_ops.on_query_obj(req)
+        resp = await async_ops.on_query_obj(statements["user_token"], session=session, 
+                                            params={"user_id": user[0].id})
+        if not resp:
+            # token dropped by on_logout
+            resp = await async_ops.on_insert_obj(Token(user_id=user[0].id), session=session)
+    # committed before the cache is invalidated ---> a concurrent load cannot re-cache the old state
+    await session.commit()
+    # re-login ---> reload the user on next use
+    user_cache.invalidate(resp[0].token.hex)
     return {"token": resp[0].token, "status": "success"}
+
+
+@router.post("/on_logout")
+async def on_logout(token: str, session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
+    """
+        drop the token and its cached user
+    """
+    token = on_uuid(token, 401, "invalid token")
+    await session.execute(delete(Token).where(Token.token == token))
+    # committed first ---> a load between the delete and the commit cannot re-cache the token
+    await session.commit()
+    user_cache.invalidate(token.hex)
+    return {"status": "success"}
     #return RedirectResponse(url=f"/register")
 
 @router.get("/on_deploy")
-async def on_deploy(token: str):
+async def on_deploy(token: str, session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
     user = await get_current_user(token)
     exp_obj = Experiment(user_id=user.id)
     exp_obj.user = user
-    resp = await async_ops.on_insert_obj(exp_obj)
+    resp = await async_ops.on_insert_obj(exp_obj, session=session)
     # 返回部署的实验id
     return {"experiment_id": resp[0].experiment_id, "status": "success"}
 
 @router.get("/on_display")
 async def on_display(token: str):
     user = await get_current_user(token)
-    req = select(Experiment).where(Experiment.user_id == user.id)
-    experiment = await async_ops.on_query_obj(req)
+    experiment = await async_ops.on_query_shared(statements["user_experiments"], params={"user_id": user.id})
     return {"experiment": experiment, "status": "success"}  
 
 
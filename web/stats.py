@@ -1,42 +1,99 @@
 # !/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from typing import List
+import json
+import asyncio
+from typing import List, Dict, Union
 from sqlalchemy import select, and_
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.ops.operator import async_ops
+from core.ops.statements import statements
 from core.ops.schema import Account
 from core.event import MetricEvent
-from .login import get_current_user
+from core.trade.codec import decode_positions
+from .login import get_current_user, get_experiment
+from .feed import feed
 
 router = APIRouter()
 
 
 @router.get("/on_stats")
 async def on_query_account(event: MetricEvent):
-    user = await get_current_user(event.token)
-    req = select(Account).where(and_(Account.user == user.id, 
-                                     Account.experiments.c.experiment_id == event.experiment_id,
-                                     Account.date <= event.end_dt,
-                                     Account.date >= event.start_dt))
-    obj = await async_ops.on_query_obj(req)
-    return obj
+    # 401 / 404 for foreign or malformed ids, uuid bind of the owned experiment
+    user, experiment = await get_experiment(event.token, event.experiment_id)
+    # dashboards poll with identical parameters ---> one query per distinct request
+    objs = await async_ops.on_query_shared(statements["experiment_accounts"], 
+                                           params={"user_id": user.id, 
+                                                   "experiment_id": experiment.experiment_id, 
+                                                   "start_dt": event.start_dt, 
+                                                   "end_dt": event.end_dt})
+    # bytea positions ---> column lists
+    return [{"date": obj.date, 
+             "portfolio": obj.portfolio, 
+             "balance": obj.balance, 
+             "positions": {name: column.tolist() for name, column in decode_positions(obj.positions).items()}} 
+            for obj in objs]
 
 
 # broadcast
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+        fan-out broadcaster --- every connection owns a bounded send queue drained by its own writer task,
+        broadcast only enqueues so one slow or stalled client never delays the others
+        a full queue (slow consumer), a send timeout or a dead socket evicts the connection
+    """
+    def __init__(self, maxsize: int = 256, send_timeout: float = 5.0):
+        self.active_connections: Dict[WebSocket, asyncio.Queue] = {}
+        self._writers: Dict[WebSocket, asyncio.Task] = {}
+        self.maxsize = maxsize
+        self.send_timeout = send_timeout
+        self.evicted = 0
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue = asyncio.Queue(self.maxsize)
+        self.active_connections[websocket] = queue
+        self._writers[websocket] = asyncio.create_task(self._on_write(websocket, queue))
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        self.active_connections.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+    async def _on_write(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._on_evict(websocket)
+
+    def _on_evict(self, websocket: WebSocket):
+        if websocket not in self.active_connections:
+            return
+        self.evicted += 1
+        self.disconnect(websocket)
+        asyncio.create_task(self._on_close(websocket))
+
+    @staticmethod
+    async def _on_close(websocket: WebSocket):
+        try:
+            # 1013 try again later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def broadcast(self, message: Union[str, dict]):
+        # serialized once, every queue holds the same str object
+        message = message if isinstance(message, str) else json.dumps(message, default=str)
+        for websocket, queue in list(self.active_connections.items()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._on_evict(websocket)
 
 manager = ConnectionManager()
 
@@ -52,6 +109,37 @@ async def websocket_endpoint(websocket: WebSocket):
         manager.disconnect(websocket)
 
 
+@router.websocket("/ws/feed/{experiment_id}")
+async def feed_endpoint(websocket: WebSocket, experiment_id: str, token: str):
+    """
+        push ledger deltas (fills / positions / portfolio) of one experiment as they happen
+        slow clients are coalesced to the latest state per key instead of blocking publishers
+    """
+    try:
+        await get_experiment(token, experiment_id)
+    except HTTPException:
+        # unknown token or an experiment of another user ---> never subscribed
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    queue = feed.subscribe(experiment_id)
+
+    async def _on_send():
+        while True:
+            await websocket.send_text(await queue.get())
+
+    sender = asyncio.create_task(_on_send())
+    try:
+        while True:
+            # client messages are ignored, receive detects the disconnect
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        feed.unsubscribe(experiment_id, queue)
+
+
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str, token: str):
     if token != "secure_token":  # Example token validation
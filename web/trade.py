@@ -1,41 +1,143 @@
-from fastapi import APIRouter
-from core.event import TradeEvent, EquityEvent, SyncEvent
-from core.trade.ledger import ledger
-from core.ops.schema import Order, Experiment
+import uuid
+from typing import List
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.event import TradeEvent, EquityEvent, SyncEvent, SyncArrayEvent
+from core.trade.ledger import ledgers
+from core.trade.meta import OrderMeta
+from core.trade.order import create_order
+from core.ops.schema import Order, Transaction, Experiment, Account
 from core.ops.operator import async_ops
-from .login import get_current_user
+from core.ops.statements import statements
+from core.ops.writebehind import write_behind
+from .login import get_current_user, get_experiment
+from .feed import feed
 
 router = APIRouter()
 
 
+def on_volume(order_meta: OrderMeta) -> int:
+    """
+        volume persisted for an order without a fill, known before the ledger moves
+        a market CallOrder carries price 0 ---> its cash amount, never amount // 0
+    """
+    if order_meta.direction:
+        return order_meta.size
+    if order_meta.price > 0:
+        return create_order(order_meta).calc_volume(order_meta.price)
+    return order_meta.amount
+
+
+async def _on_persist(orders, txns, volumes, experiment, session: AsyncSession):
+    """
+        orders / transactions / order_transaction links of one experiment ---> write behind or the session commit
+    """
+    rows = []
+    for order, txn, volume in zip(orders, txns, volumes):
+        order_id = uuid.uuid4()
+        order_row = {"order_id": order_id,
+                     "sid": order.asset.sid,
+                     "created_dt": int(order.created_dt),
+                     "order_type": order.order_type,
+                     "price": order.price,
+                     # filled size once the broker matched the order, integer columns
+                     "volume": round(txn.size) if txn else volume,
+                     "experiment_id": experiment.id}
+        txn_row = {"transaction_id": uuid.uuid4().hex,
+                   "sid": txn.sid,
+                   "created_dt": int(txn.created_dt.strftime("%Y%m%d%H%M")),
+                   "price": txn.price,
+                   "volume": round(txn.size),
+                   "cost": txn.cost,
+                   "order_id": order_id} if txn else None
+        rows.append((order_row, txn_row))
+
+    if write_behind.running:
+        # acknowledged once journaled, flushed to postgres by the background task
+        for order_row, txn_row in rows:
+            write_behind.put("_order", order_row)
+            if txn_row:
+                write_behind.put("transaction", txn_row)
+                write_behind.put("order_transaction", {"order_id": order_row["order_id"], 
+                                                       "transaction_id": txn_row["transaction_id"]})
+        return
+
+    objs = []
+    for order_row, txn_row in rows:
+        order_obj = Order(**order_row)
+        if txn_row:
+            # secondary relationship emits the order_transaction link row
+            order_obj.transactions.append(Transaction(**txn_row))
+        objs.append(order_obj)
+    await async_ops.on_insert_obj(objs, session=session)
+
+
 @router.post("/on_execute")
-async def on_execute(event: TradeEvent):
-    # execute trade
-    order, txns = await ledger.on_trade(event)
-    
-    user = await get_current_user(event.token)
-    experiment = Experiment(user_id=user.id, experiment_id=event.experiment_id)
-    
-    order.experiment = experiment
-    order.transactions.extend(txns)
-    await async_ops.on_insert_obj(order)
+async def on_execute(event: TradeEvent, session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
+    # 401 / 404 and the persisted volume before the ledger, feed and journal see the order
+    _, experiment = await get_experiment(event.token, event.experiment_id, session=session)
+    volume = on_volume(event.orderMeta)
+    ledger = await ledgers.acquire(event.experiment_id)
+    order, txn = await ledger.on_trade(event)
+    feed.on_ledger(event.experiment_id, ledger, [txn])
+    await _on_persist([order], [txn], [volume], experiment, session)
+    return {"filled": int(bool(txn)), "status": "success"}
 
-    txns.order = order
-    await async_ops.on_insert_obj(txns)
+
+@router.post("/on_execute_batch")
+async def on_execute_batch(events: List[TradeEvent], session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
+    """
+        orders of one experiment run through the ledger in order,
+        orders / transactions / order_transaction links persisted in one session commit
+    """
+    if len({(event.experiment_id, event.token) for event in events}) > 1:
+        raise HTTPException(status_code=400, detail="batch must target one experiment")
+    if not events:
+        return {"filled": 0, "status": "success"}
+
+    # 401 / 404 and the persisted volumes before the ledger, feed and journal see the orders
+    _, experiment = await get_experiment(events[0].token, events[0].experiment_id, session=session)
+    volumes = [on_volume(event.orderMeta) for event in events]
+    ledger = await ledgers.acquire(events[0].experiment_id)
+    orders, txns = await ledger.on_trade_batch(events)
+    feed.on_ledger(events[0].experiment_id, ledger, txns)
+    await _on_persist(orders, txns, volumes, experiment, session)
+    return {"filled": sum(1 for txn in txns if txn), "status": "success"}
 
 
 @router.post("/on_event")
 async def on_event(event: EquityEvent):
+        await get_experiment(event.token, event.experiment_id)
+        ledger = await ledgers.acquire(event.experiment_id)
         avaiable = await ledger.on_event(event)
+        feed.on_ledger(event.experiment_id, ledger, sids=event.meta or ())
         return avaiable
 
 
 @router.post("/on_sync")
-async def on_sync(event: SyncEvent):
+async def on_sync(event: SyncEvent, session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
+        user, experiment = await get_experiment(event.token, event.experiment_id, session=session)
+        ledger = await ledgers.acquire(event.experiment_id)
+        obj_account, obj_metrics = await ledger.on_end_of_day(event)
+        feed.on_ledger(event.experiment_id, ledger, sids=ledger.portfolio.exposure.holding)
+        # account row of the existing experiment
+        account = Account(**obj_account.model_dump(), account_id=user.account_id, experiment_id=experiment.id)
+        await async_ops.on_insert_obj(account, session=session)
+        return obj_metrics
+
+
+@router.post("/on_sync_arrays")
+async def on_sync_arrays(event: SyncArrayEvent, session: AsyncSession = Depends(async_ops.get_uow, scope="function")):
+        """
+            on_sync with closes as base64 float64 array instead of a sid ---> price json mapping
+        """
+        user, experiment = await get_experiment(event.token, event.experiment_id, session=session)
+        ledger = await ledgers.acquire(event.experiment_id)
         obj_account, obj_metrics = await ledger.on_end_of_day(event)
-        experiment = Experiment(**event.experiment.model_dump())
-        obj_account.experiment = experiment
-        await async_ops.on_insert_obj(obj_account)
+        feed.on_ledger(event.experiment_id, ledger, sids=ledger.portfolio.exposure.holding)
+        account = Account(**obj_account.model_dump(), account_id=user.account_id, experiment_id=experiment.id)
+        await async_ops.on_insert_obj(account, session=session)
         return obj_metrics
 
 